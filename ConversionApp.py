@@ -1,51 +1,34 @@
+import argparse
 import streamlit as st
 from pathlib import Path
-import tempfile
 
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions, AcceleratorDevice
+from conversion import CONVERSION_WORKERS, conversion_cache_stats, convert_batch, start_conversion_workers, warm_converters
+from doc_store import read_bytes, store_document, zip_file
+from uploads import ScratchQuotaExceeded, ScratchSpace
 
 
-def convert_to_markdown(file_path: str) -> str:
-    path = Path(file_path)
-    ext = path.suffix.lower()
-
-    if ext == ".pdf":
-        pdf_opts = PdfPipelineOptions(do_ocr=False)
-        pdf_opts.accelerator_options = AcceleratorOptions(
-            num_threads=4,
-            device=AcceleratorDevice.CPU
-        )
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_options=pdf_opts,
-                    backend=DoclingParseV2DocumentBackend
-                )
-            }
-        )
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext in [".doc", ".docx"]:
-        converter = DocumentConverter()
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext == ".txt":
-        try:
-            return path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            return path.read_text(encoding="latin-1", errors="replace")
-
-    raise ValueError(f"Unsupported extension: {ext}")
+def parse_args():
+    """Settings passed after `--`, e.g. `streamlit run ConversionApp.py -- --workers 4`"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=CONVERSION_WORKERS,
+                        help="number of worker processes used for conversion")
+    args, _ = parser.parse_known_args()
+    return args
 
 
 def main():
+    args = parse_args()
     st.title("Batch Document to Markdown")
 
+    # With a single worker we convert in this process, so load the docling
+    # models once up front; later reruns reuse them. Otherwise start the worker
+    # processes now: they load their models while the user picks files
+    if args.workers <= 1:
+        with st.spinner("Loading conversion models..."):
+            warm_converters()
+    else:
+        start_conversion_workers(args.workers)
+
     uploaded = st.file_uploader(
         "Choose files (PDF, DOC, DOCX, TXT)",
         type=["pdf", "doc", "docx", "txt"],
@@ -57,7 +40,7 @@ def main():
         value="output_markdown"
     )
 
-    # prepare session state for downloads
+    # prepare session state for downloads (small dicts; the text stays on disk, see doc_store.py)
     if "downloads" not in st.session_state:
         st.session_state.downloads = []
 
@@ -77,39 +60,64 @@ def main():
 
         total = len(uploaded)
 
-        for idx, up in enumerate(uploaded, start=1):
-            name = up.name
-            status.text(f"Converting {name} ({idx}/{total})")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=Path(name).suffix) as tmp:
-                tmp.write(up.getvalue())
-                tmp_path = tmp.name
-
-            try:
-                md = convert_to_markdown(tmp_path)
-                out_file = out_folder / f"{Path(name).stem}.md"
-                out_file.write_text(md, encoding="utf-8", errors="replace")
-
-                # store for download
-                st.session_state.downloads.append((out_file.name, md))
-
-            except Exception as e:
-                st.warning(f"Failed: {name}: {e}")
-
-            progress.progress(idx / total)
+        # stream uploads into a scratch folder the worker processes can read;
+        # the folder is deleted as soon as the batch is done
+        with ScratchSpace() as scratch:
+            names = {}
+            for up in uploaded:
+                try:
+                    names[scratch.save(up)] = up.name
+                except ScratchQuotaExceeded as e:
+                    st.error(str(e))
+                    return
+
+            status.text(f"Converting {total} files with {args.workers} workers...")
+
+            # results arrive as each file finishes, not in upload order
+            for idx, result in enumerate(convert_batch(names, workers=args.workers), start=1):
+                name = names[result.path]
+                try:
+                    if result.error:
+                        raise RuntimeError(result.error)
+                    md = result.markdown
+                    out_file = out_folder / f"{Path(name).stem}.md"
+                    out_file.write_text(md, encoding="utf-8", errors="replace")
+
+                    # store for download
+                    st.session_state.downloads.append(store_document(name, md))
+
+                except Exception as e:
+                    st.warning(f"Failed: {name}: {e}")
+
+                cached = " (cached)" if result.cached else ""
+                status.text(f"Converted {name} in {result.seconds:.1f}s{cached} ({idx}/{total})")
+                progress.progress(idx / total)
 
         status.text("Conversion done.")
         st.success(f"Saved markdown files to {out_folder.resolve()}")
+        cache = conversion_cache_stats()
+        st.caption(f"Conversion cache: {cache['hits']} hits, {cache['misses']} misses, "
+                   f"{cache['entries']} entries ({cache['size_mb']} MB)")
 
     # show download buttons after conversion
     if st.session_state.downloads:
         st.markdown("### Download Converted Files")
-        for name, md in st.session_state.downloads:
+        # the files are only read from disk when a button is clicked
+        st.download_button(
+            label="Download all as zip",
+            data=lambda docs=list(st.session_state.downloads): zip_file(docs),
+            file_name="converted_markdown.zip",
+            mime="application/zip",
+            key="dl_all"
+        )
+        for doc in st.session_state.downloads:
+            name = f"{Path(doc['filename']).stem}.md"
             st.download_button(
                 label=f"Download {name}",
-                data=md,
+                data=lambda key=doc['key']: read_bytes(key),
                 file_name=name,
                 mime="text/markdown",
-                key=f"dl_{name}"
+                key=f"dl_{doc['filename']}"
             )
 
 
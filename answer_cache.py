@@ -0,0 +1,138 @@
+"""
+Process-wide cache of generated answers.
+
+The same few questions are asked over and over, by every session. An answer is
+kept per collection under the normalized question and reused for as long as the
+collection's corpus version (vector_store.corpus_version) is unchanged, so
+adding or deleting documents invalidates every cached answer for it.
+
+With ANSWER_CACHE_SEMANTIC=1 a question that is not cached word for word can
+still reuse the answer of a cached question whose embedding is close enough
+(cosine similarity >= ANSWER_CACHE_SIMILARITY), e.g. "Queen's albums in the
+1980s?" and "What albums did Queen release in the 1980s?".
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embeddings import embed_query
+from telemetry import record
+from vector_store import corpus_version
+
+
+# How many answers are kept (least recently used are dropped first), 0 disables the cache
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+# Answers older than this many seconds are generated again
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Also match questions by meaning, not just by text
+ANSWER_CACHE_SEMANTIC = os.environ.get("ANSWER_CACHE_SEMANTIC", "0") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# (collection name, normalized question) -> entry dict
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "invalidated": 0}
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    return " ".join(question.casefold().split()).rstrip(" ?!.")
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _usable(key, entry, version, now):
+    """Drop the entry if it is stale; True if it can be served"""
+    if entry["version"] == version and now - entry["stored_at"] <= ANSWER_CACHE_TTL_SECONDS:
+        return True
+    del _entries[key]
+    _stats["invalidated"] += 1
+    return False
+
+
+def _semantic_match(name, vector, version, now):
+    """The cached entry of this collection most similar to `vector`, if close enough"""
+    best_key, best_score = None, ANSWER_CACHE_SIMILARITY
+    for key, entry in list(_entries.items()):
+        if key[0] != name or entry["vector"] is None or not _usable(key, entry, version, now):
+            continue
+        score = float(np.dot(vector, entry["vector"]))
+        if score >= best_score:
+            best_key, best_score = key, score
+    return best_key
+
+
+def get(collection, question):
+    """The cached (answer, source) for a question, or None"""
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    # the lookup's real duration is recorded, hit or miss (semantic lookups embed the question)
+    start = time.perf_counter()
+    name = collection.name
+    key = (name, normalize_question(question))
+    version = corpus_version(name)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and _usable(key, entry, version, now):
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            record("answer_cache", time.perf_counter() - start, cache_hit=True)
+            return entry["answer"], entry["source"]
+
+    if ANSWER_CACHE_SEMANTIC:
+        # embed_query is cached, and the same vector is used again for retrieval
+        vector = _unit(embed_query(question))
+        with _lock:
+            match = _semantic_match(name, vector, version, now)
+            if match is not None:
+                entry = _entries[match]
+                _entries.move_to_end(match)
+                _stats["semantic_hits"] += 1
+                record("answer_cache", time.perf_counter() - start, cache_hit=True)
+                return entry["answer"], entry["source"]
+
+    with _lock:
+        _stats["misses"] += 1
+    record("answer_cache", time.perf_counter() - start, cache_hit=False)
+    return None
+
+
+def put(collection, question, answer, source):
+    """Remember the answer to a question for the collection's current contents"""
+    if ANSWER_CACHE_SIZE <= 0:
+        return
+    name = collection.name
+    entry = {
+        "answer": answer,
+        "source": source,
+        "version": corpus_version(name),
+        "stored_at": time.time(),
+        "vector": _unit(embed_query(question)) if ANSWER_CACHE_SEMANTIC else None,
+    }
+    with _lock:
+        key = (name, normalize_question(question))
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > ANSWER_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+
+def clear():
+    """Forget every cached answer"""
+    with _lock:
+        _entries.clear()
+
+
+def answer_cache_stats():
+    """Hit/miss counters and size of the answer cache"""
+    with _lock:
+        return dict(_stats, size=len(_entries), max_size=ANSWER_CACHE_SIZE,
+                    semantic=ANSWER_CACHE_SEMANTIC)
@@ -0,0 +1,196 @@
+"""
+Runs question answering off the Streamlit script thread.
+
+Questions from every session go through one bounded pool of worker threads, so
+a slow flan-t5 generation no longer freezes the page and concurrent users are
+scheduled instead of all competing for the CPU at once:
+
+    request = submit(get_answer_with_source, collection, question)
+    ...
+    if request.done():
+        answer, source = request.result()
+
+A session cancels its previous request when the user asks a new question.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from telemetry import record
+
+
+# How many questions are answered at the same time. Non-streamed generation is
+# funnelled through the shared batcher in models.py and streamed generation is
+# capped at MAX_STREAMED_GENERATIONS, so this mostly bounds how many prompts can
+# be waiting for the model; keep it near GENERATION_BATCH_SIZE
+ANSWER_WORKERS = int(os.environ.get("ANSWER_WORKERS", "8"))
+# How many questions may wait (or run) before new ones are turned away
+ANSWER_QUEUE_SIZE = int(os.environ.get("ANSWER_QUEUE_SIZE", "32"))
+# A question that has not been answered after this many seconds is given up on
+ANSWER_TIMEOUT_SECONDS = float(os.environ.get("ANSWER_TIMEOUT_SECONDS", "60"))
+
+_executor = None
+_pending = 0            # questions submitted and not finished (or cancelled) yet
+_lock = threading.Lock()
+
+
+class AnswerQueueFull(Exception):
+    """Raised by submit() when ANSWER_QUEUE_SIZE questions are already pending"""
+
+
+class AnswerTimeout(Exception):
+    """Raised by AnswerRequest.result() when the request ran out of time"""
+
+
+class AnswerCancelled(Exception):
+    """Raised by AnswerRequest.result() when the request was cancelled"""
+
+
+def _take_slot():
+    """Count one more pending question; False if ANSWER_QUEUE_SIZE are already pending"""
+    global _pending
+    with _lock:
+        if _pending >= ANSWER_QUEUE_SIZE:
+            return False
+        _pending += 1
+        return True
+
+
+def _free_slot():
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANSWER_WORKERS, thread_name_prefix="answer")
+        return _executor
+
+
+class AnswerRequest:
+    """One queued question; poll it with done() / status() and read result()"""
+
+    def __init__(self, timeout):
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.submitted_at + timeout
+        self.cancelled = threading.Event()
+        self.future = None
+        self.tokens = queue.Queue()     # answer pieces, for streaming requests
+        self.first_token_at = None
+
+    def _push_token(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+        self.tokens.put(text)
+
+    def stream(self, poll_interval: float = 0.05):
+        """
+        Yield answer pieces as the worker produces them (for st.write_stream),
+        until the request finishes, is cancelled or times out
+        """
+        while True:
+            try:
+                yield self.tokens.get(timeout=poll_interval)
+                continue
+            except queue.Empty:
+                pass
+            if self.done():
+                break
+        # pieces that arrived just before the end
+        while not self.tokens.empty():
+            yield self.tokens.get_nowait()
+
+    def time_to_first_token(self):
+        """Seconds from submit to the first streamed piece (None if none yet)"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.submitted_at
+
+    def _run(self, fn, args, kwargs):
+        try:
+            # Skip work nobody is waiting for any more
+            if self.cancelled.is_set():
+                raise AnswerCancelled("Request was cancelled")
+            if time.time() > self.deadline:
+                raise AnswerTimeout("Request timed out while waiting in the queue")
+            self.started_at = time.time()
+            record("answer_queue_wait", self.started_at - self.submitted_at)
+            return fn(*args, **kwargs)
+        finally:
+            self.finished_at = time.time()
+            if self.started_at:
+                record("answer", self.finished_at - self.started_at)
+            _free_slot()
+
+    def cancel(self):
+        """Stop waiting for this request; it is dropped if it has not started yet"""
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self):
+        return self.future.done() or self.cancelled.is_set() or time.time() > self.deadline
+
+    def status(self):
+        """'queued', 'running', 'done', 'failed', 'cancelled' or 'timed out'"""
+        if self.cancelled.is_set() or self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() else "done"
+        if time.time() > self.deadline:
+            return "timed out"
+        return "running" if self.started_at else "queued"
+
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+    def result(self, wait: bool = False):
+        """
+        The answer. With wait=True, blocks until it is ready or the deadline
+        passes. Raises AnswerCancelled, AnswerTimeout, or whatever the answer
+        function raised.
+        """
+        if self.cancelled.is_set():
+            raise AnswerCancelled("Request was cancelled")
+        remaining = self.deadline - time.time() if wait else 0
+        try:
+            return self.future.result(timeout=max(0, remaining))
+        except CancelledError:
+            raise AnswerCancelled("Request was cancelled")
+        except TimeoutError:
+            raise AnswerTimeout(f"No answer after {self.elapsed():.0f}s")
+
+
+def submit(fn, *args, timeout: float = None, stream: bool = False, **kwargs):
+    """
+    Queue fn(*args, **kwargs) on the answer workers and return an AnswerRequest.
+    With stream=True, fn is also given on_token= and cancel_event= so it can
+    publish partial answers (read them with request.stream()) and stop early.
+    Raises AnswerQueueFull if too many questions are already waiting.
+    """
+    if not _take_slot():
+        raise AnswerQueueFull("The answer queue is full, please try again in a moment.")
+    request = AnswerRequest(ANSWER_TIMEOUT_SECONDS if timeout is None else timeout)
+    if stream:
+        kwargs = dict(kwargs, on_token=request._push_token, cancel_event=request.cancelled)
+    try:
+        request.future = _get_executor().submit(request._run, fn, args, kwargs)
+    except BaseException:
+        _free_slot()
+        raise
+    # A request cancelled before it started never runs _run, so free its slot here
+    request.future.add_done_callback(lambda f: f.cancelled() and _free_slot())
+    return request
+
+
+def queue_info():
+    """How many questions are waiting or running right now"""
+    with _lock:
+        return {"pending": _pending, "workers": ANSWER_WORKERS}
@@ -1,29 +1,22 @@
 # Simple Q&A App using Streamlit
 # Students: Replace the documents below with your own!
-# Fix SQLite version issue for ChromaDB on Streamlit Cloud
-try:
-    __import__('pysqlite3')
-    import sys
-    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-except ImportError:
-    pass
 # IMPORTS - These are the libraries we need
 import streamlit as st          # Creates web interface components
-import chromadb                # Stores and searches through documents  
-from transformers import pipeline  # AI model for generating answers
+import hashlib                 # Fingerprints documents so we only store each one once
+from vector_store import get_collection  # Stores and searches through documents (saved on disk)
+from embeddings import embed_documents, embed_query  # Turns text into vectors (same model for documents and questions)
+from models import GENERATION_MODEL, generate_text, warm_models_in_background  # AI model for generating answers
+import os
 
+@st.cache_resource
 def setup_documents():
     """
     This function creates our document database
-    NOTE: This runs every time someone uses the app
-    In a real app, you'd want to save this data permanently
+    NOTE: @st.cache_resource makes this run once per server process; every
+    rerun and every user shares the result. The database is saved on disk
+    (see vector_store.py), so after a restart the documents are already there
     """
-    client = chromadb.Client()
-    client = chromadb.Client()
-    try:
-        collection = client.get_collection(name="docs")
-    except Exception:
-        collection = client.create_collection(name="docs")
+    collection = get_collection("docs")
     
     # STUDENT TASK: Replace these 5 documents with your own!
     # Pick ONE topic: movies, sports, cooking, travel, technology
@@ -46,13 +39,32 @@ def setup_documents():
     
     # Add documents to database with unique IDs
     # ChromaDB needs unique identifiers for each document
-    collection.add(
-        documents=my_documents,
-        ids=["doc1", "doc2", "doc3", "doc4", "doc5"]
-    )
+    seed_documents(collection, my_documents)
     
     return collection
 
+def seed_documents(collection, documents):
+    """
+    Store the documents, skipping any that are already in the database unchanged.
+    Only new or edited documents get embedded. Returns how many were (re)added
+    """
+    ids = [f"doc{i+1}" for i in range(len(documents))]
+    hashes = [hashlib.sha256(doc.encode("utf-8")).hexdigest() for doc in documents]
+    
+    # Check what is already there
+    existing = collection.get(ids=ids, include=["metadatas"])
+    stored = {id_: (meta or {}).get("doc_hash") for id_, meta in zip(existing["ids"], existing["metadatas"])}
+    
+    todo = [i for i, id_ in enumerate(ids) if stored.get(id_) != hashes[i]]
+    if todo:
+        collection.upsert(
+            documents=[documents[i] for i in todo],
+            embeddings=embed_documents([documents[i] for i in todo]).tolist(),
+            ids=[ids[i] for i in todo],
+            metadatas=[{"doc_hash": hashes[i]} for i in todo]
+        )
+    return len(todo)
+
 def get_answer(collection, question):
     """
     This function searches documents and generates answers while minimizing hallucination
@@ -61,7 +73,7 @@ def get_answer(collection, question):
     # STEP 1: Search for relevant documents in the database
     # We get 3 documents instead of 2 for better context coverage
     results = collection.query(
-        query_texts=[question],    # The user's question
+        query_embeddings=[embed_query(question)],    # The user's question, as a vector
         n_results=3               # Get 3 most similar documents
     )
     
@@ -97,14 +109,15 @@ Instructions: Answer ONLY using the information provided above. If the answer is
 Answer:"""
     
     # STEP 6: Generate answer with anti-hallucination parameters
-    ai_model = pipeline("text2text-generation", model="google/flan-t5-small")
-    response = ai_model(
+    # The model is loaded once per process; questions from users asking at
+    # the same moment are generated together in one batch
+    generated_text = generate_text(
         prompt, 
         max_length=150
     )
     
     # STEP 7: Extract and clean the generated answer
-    answer = response[0]['generated_text'].strip()
+    answer = generated_text.strip()
     
 
     
@@ -130,9 +143,14 @@ st.write("🎤 Welcome to my deep dive into the legendary rock band Queen! Explo
 
 # STREAMLIT BUILDING BLOCK 3: FUNCTION CALLS
 # We call our function to set up the document database
-# This happens every time someone uses the app
+# Thanks to @st.cache_resource this only does real work on the first run
 collection = setup_documents()
 
+# Optionally start loading the answer model now, so the first question is fast
+# (set WARM_MODELS_ON_STARTUP=1 to enable)
+if os.environ.get("WARM_MODELS_ON_STARTUP") == "1":
+    warm_models_in_background([GENERATION_MODEL])
+
 # STREAMLIT BUILDING BLOCK 4: TEXT INPUT BOX
 # st.text_input() creates a box where users can type
 # - First parameter: Label that appears above the box
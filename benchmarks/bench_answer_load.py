@@ -0,0 +1,100 @@
+"""
+Load test for the answer pipeline: N simulated users ask questions at once.
+
+Each user thread submits a question through answer_service, waits for the
+answer and immediately asks the next one. Latency is measured from submit to
+answer, so it includes time spent queued.
+
+Needs a populated "documents" collection (upload some files in final_app.py first).
+
+Usage: python benchmarks/bench_answer_load.py [--users 1 4 8] [--questions 5] [--workers 2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+QUESTIONS = [
+    "What albums did Queen release in the 1980s?",
+    "Who was the lead singer of Queen?",
+    "When did Queen form?",
+    "Which song did John Deacon write?",
+    "What awards did Queen win?",
+    "What guitar did Brian May play?",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_load(answer_service, fn, collection, users, questions):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user(n):
+        for q in range(questions):
+            question = QUESTIONS[(n + q) % len(QUESTIONS)]
+            start = time.perf_counter()
+            try:
+                answer_service.submit(fn, collection, question).result(wait=True)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ["ANSWER_WORKERS"] = str(args.workers)
+    os.environ.setdefault("ANSWER_QUEUE_SIZE", "1024")
+
+    import answer_service
+    import qa
+    import vector_store
+
+    collection = vector_store.get_collection("documents")
+    if not collection.count():
+        print("The 'documents' collection is empty; upload documents first.")
+        sys.exit(1)
+
+    # warm the models so the first user does not pay for loading them
+    qa.get_answer_with_source(collection, QUESTIONS[0])
+
+    print(f"workers: {answer_service.ANSWER_WORKERS}")
+    print(f"{'users':>6} {'answers':>8} {'p50 s':>7} {'p95 s':>7} {'answers/s':>10} {'errors':>7}")
+    for users in args.users:
+        latencies, errors, wall = run_load(
+            answer_service, qa.get_answer_with_source, collection, users, args.questions
+        )
+        if not latencies:
+            print(f"{users:>6} {0:>8} {'-':>7} {'-':>7} {'-':>10} {len(errors):>7}")
+            continue
+        print(f"{users:>6} {len(latencies):>8} {percentile(latencies, 50):>7.2f} "
+              f"{percentile(latencies, 95):>7.2f} {len(latencies) / wall:>10.2f} {len(errors):>7}")
+
+
+if __name__ == "__main__":
+    main()
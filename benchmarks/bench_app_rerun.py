@@ -0,0 +1,75 @@
+"""
+Rerun latency of app.py.
+
+"before" repeats what every rerun used to do: create an in-memory Chroma
+client and add (embed) the five seed documents again. "after" drives the real
+app with Streamlit's AppTest, so setup_documents() is served from
+st.cache_resource after the first run.
+
+Usage: python benchmarks/bench_app_rerun.py [--runs 10]
+"""
+import argparse
+import ast
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Keep the benchmark's seed index away from the app's real one
+os.environ.setdefault("CHROMA_PERSIST_DIR", tempfile.mkdtemp(prefix="bench_app_"))
+
+
+def seed_documents_from_app():
+    """Pull the my_documents list out of app.py without running the app"""
+    tree = ast.parse((ROOT / "app.py").read_text(encoding="utf-8"))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "my_documents":
+            return ast.literal_eval(node.value)
+    raise RuntimeError("my_documents not found in app.py")
+
+
+def before(runs):
+    import chromadb
+
+    documents = seed_documents_from_app()
+    times = []
+    for run in range(runs):
+        start = time.perf_counter()
+        client = chromadb.EphemeralClient()
+        name = f"docs_{run}"   # a fresh client per rerun used to mean an empty collection
+        collection = client.get_or_create_collection(name=name)
+        collection.add(documents=documents, ids=[f"doc{i+1}" for i in range(len(documents))])
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def after(runs):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=600)
+    times = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    return times[0], times[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    old = before(args.runs)
+    first, new = after(args.runs)
+    print(f"before: seeding per rerun median {median(old) * 1000:.1f} ms")
+    print(f"after:  first run {first * 1000:.1f} ms, rerun median {median(new) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
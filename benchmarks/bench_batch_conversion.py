@@ -0,0 +1,61 @@
+"""
+Batch conversion throughput (files/min) for different worker counts.
+
+Usage: python benchmarks/bench_batch_conversion.py [--workers 1 2 4 8] file1.pdf file2.pdf ...
+
+Each worker count is run twice: the first pass includes starting the worker
+processes and loading their models, the second shows steady-state throughput
+with warm workers.
+
+The on-disk conversion cache would answer every pass after the first, so it is
+pointed at a temporary directory (inherited by the worker processes) that is
+emptied before each pass: every pass really converts.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+CACHE_DIR = tempfile.mkdtemp(prefix="bench_conversion_cache_")
+os.environ["CONVERSION_CACHE_DIR"] = CACHE_DIR
+
+import conversion
+
+
+def clear_cache():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+def run(files, workers):
+    clear_cache()
+    start = time.perf_counter()
+    failed = sum(1 for result in conversion.convert_batch(files, workers=workers) if result.error)
+    elapsed = time.perf_counter() - start
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'pass':>5} {'seconds':>9} {'files/min':>10} {'failed':>7}")
+    for workers in args.workers:
+        for label in ("cold", "warm"):
+            elapsed, failed = run(args.files, workers)
+            rate = len(args.files) / elapsed * 60
+            print(f"{workers:>8} {label:>5} {elapsed:>9.2f} {rate:>10.1f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
@@ -0,0 +1,68 @@
+"""
+Cold vs. warm per-file conversion latency.
+
+"cold" builds a brand-new DocumentConverter for every file (what
+convert_to_markdown used to do), "warm" borrows one from the process-wide pool.
+Both skip the on-disk conversion cache, so every file is really converted.
+
+Usage: python benchmarks/bench_converter_pool.py sample1.pdf sample2.docx ...
+"""
+import sys
+import time
+from pathlib import Path
+from statistics import median
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from docling.datamodel.pipeline_options import AcceleratorDevice
+from docling.document_converter import DocumentConverter
+
+import conversion
+
+
+def cold_convert(file_path):
+    ext = Path(file_path).suffix.lower()
+    if ext == ".pdf":
+        converter = conversion._pdf_converter_factory(
+            conversion.PDF_DO_OCR, conversion.PDF_NUM_THREADS, AcceleratorDevice.CPU
+        )()
+    else:
+        converter = DocumentConverter()
+    return converter.convert(file_path).document.export_to_markdown(image_mode="placeholder")
+
+
+def warm_convert(file_path):
+    fmt = "pdf" if Path(file_path).suffix.lower() == ".pdf" else "docx"
+    return conversion._docling_to_markdown(file_path, fmt)
+
+
+def timed(fn, files):
+    times = []
+    for f in files:
+        start = time.perf_counter()
+        fn(f)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    files = [f for f in sys.argv[1:] if Path(f).suffix.lower() in (".pdf", ".doc", ".docx")]
+    if not files:
+        print(__doc__)
+        sys.exit(1)
+
+    cold = timed(cold_convert, files)
+
+    start = time.perf_counter()
+    conversion.warm_converters()
+    warmup = time.perf_counter() - start
+    warm = timed(warm_convert, files)
+
+    print(f"files: {len(files)}")
+    print(f"one-off warm-up: {warmup:.2f}s")
+    print(f"cold per file: median {median(cold):.2f}s, total {sum(cold):.2f}s")
+    print(f"warm per file: median {median(warm):.2f}s, total {sum(warm):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
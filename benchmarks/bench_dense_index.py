@@ -0,0 +1,95 @@
+"""
+Top-k latency, recall and memory: Chroma's query vs. the NumPy index (dense_index.py).
+
+Random unit vectors stand in for chunk embeddings (no model needed). For every
+corpus size they are loaded into a throw-away in-memory Chroma collection and
+into a DenseIndex per dtype; queries are perturbed copies of stored vectors.
+Recall@k is measured against an exact float32 search.
+
+Loading 500k vectors into Chroma takes a while (HNSW build).
+
+Usage: python benchmarks/bench_dense_index.py [--sizes 10000 100000 500000] [--queries 100] [--k 10]
+       [--dim 384] [--mmap-dir /tmp/dense_bench]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+os.environ["VECTOR_STORE_MODE"] = "memory"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import vector_store
+from dense_index import DenseIndex
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def unit(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def time_queries(search, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--mmap-dir", default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>7} {'backend':>16} {'p50 ms':>7} {'p95 ms':>7} {'recall':>7} {'MB':>7}")
+    for size in args.sizes:
+        vectors = unit(rng.normal(size=(size, args.dim)).astype(np.float32))
+        ids = [f"bench.md_chunk_{i}" for i in range(size)]
+        metadatas = [{"filename": "bench.md"}] * size
+        picks = rng.choice(size, args.queries, replace=False)
+        queries = unit(vectors[picks] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+        exact = [set(np.argsort(-(vectors @ q))[:args.k]) for q in queries]
+
+        def report(name, latencies, found, megabytes):
+            recall = np.mean([len(e & f) / args.k for e, f in zip(exact, found)])
+            megabytes = "-" if megabytes is None else f"{megabytes:.0f}"
+            print(f"{size:>7} {name:>16} {percentile(latencies, 50):>7.2f} "
+                  f"{percentile(latencies, 95):>7.2f} {recall:>7.3f} {megabytes:>7}")
+
+        collection = vector_store.reset_collection("bench_dense")
+        batch = vector_store.get_client().get_max_batch_size()
+        for start in range(0, size, batch):
+            collection.add(ids=ids[start:start + batch], embeddings=vectors[start:start + batch],
+                           metadatas=metadatas[start:start + batch])
+        latencies, results = time_queries(
+            lambda q: collection.query(query_embeddings=[q], n_results=args.k, include=["distances"])["ids"][0],
+            queries,
+        )
+        report("chroma", latencies, [{int(i.rsplit("_", 1)[1]) for i in r} for r in results], None)
+        vector_store.reset_collection("bench_dense")
+
+        for dtype in ("float32", "float16", "int8"):
+            path = os.path.join(args.mmap_dir, f"bench.{dtype}.npy") if args.mmap_dir else None
+            index = DenseIndex(args.dim, dtype, path=path)
+            index.add(ids, vectors, metadatas)
+            latencies, results = time_queries(lambda q: index.search(q, args.k), queries)
+            name = f"numpy {dtype}" + (" mmap" if path else "")
+            report(name, latencies, [{int(i.rsplit("_", 1)[1]) for i, _ in r} for r in results],
+                   index.stats()["matrix_mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Questions/sec of flan-t5-small generation with and without micro-batching.
+
+"direct" lets every user thread call the pipeline itself (what the apps did
+before), "batched" sends every prompt through models.generate_text so prompts
+arriving within the batching window share one padded forward pass.
+
+Usage: python benchmarks/bench_generation_batching.py [--users 1 4 16] [--questions 8]
+       [--batch-size 8] [--wait-ms 20]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+CONTEXT = (
+    "Document 1: Queen's debut album, Queen (1973), introduced them as a force in hard rock. "
+    "In the 1980s they released The Game (1980), Hot Space (1982), The Works (1984), "
+    "A Kind of Magic (1986) and The Miracle (1989).\n\n"
+    "Document 2: Their final studio album with Mercury, Innuendo (1991), was followed by Made in Heaven (1995)."
+)
+QUESTIONS = [
+    "What albums did Queen release in the 1980s?",
+    "What was Queen's debut album?",
+    "When was Innuendo released?",
+    "Which album came out in 1984?",
+]
+
+
+def prompt_for(question):
+    return f"Context information:\n{CONTEXT}\n\nQuestion: {question}\n\nAnswer:"
+
+
+def run(users, questions, ask):
+    def user(n):
+        for q in range(questions):
+            ask(prompt_for(QUESTIONS[(n + q) % len(QUESTIONS)]))
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return users * questions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--questions", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--wait-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.batch_size:
+        os.environ["GENERATION_BATCH_SIZE"] = str(args.batch_size)
+    if args.wait_ms is not None:
+        os.environ["GENERATION_BATCH_WAIT_MS"] = str(args.wait_ms)
+
+    import models
+
+    pipe = models.get_pipeline(*models.GENERATION_MODEL)
+    pipe(prompt_for(QUESTIONS[0]), max_length=150)  # warm-up
+
+    def direct(prompt):
+        return pipe(prompt, max_length=150)[0]["generated_text"]
+
+    def batched(prompt):
+        return models.generate_text(prompt, max_length=150)
+
+    print(f"batch size {models.GENERATION_BATCH_SIZE}, window {models.GENERATION_BATCH_WAIT_MS} ms")
+    print(f"{'users':>6} {'direct q/s':>11} {'batched q/s':>12}")
+    for users in args.users:
+        print(f"{users:>6} {run(users, args.questions, direct):>11.2f} {run(users, args.questions, batched):>12.2f}")
+    print(models.batching_stats())
+
+
+if __name__ == "__main__":
+    main()
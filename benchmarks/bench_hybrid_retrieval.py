@@ -0,0 +1,113 @@
+"""
+Recall vs. latency of vector, keyword (BM25) and hybrid (RRF) retrieval.
+
+A synthetic corpus is stored in a throw-away in-memory collection. Every
+chunk mentions one made-up album and its year among filler text, and each
+query asks about one album, so the chunk that mentions it is the right
+answer. Recall@k is how often that chunk is among the k retrieved.
+
+--index-chunks also times the keyword index alone on a larger corpus (no
+embeddings needed), e.g. --index-chunks 100000.
+
+Usage: python benchmarks/bench_hybrid_retrieval.py [--chunks 2000] [--queries 200] [--k 8]
+       [--index-chunks 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+os.environ["VECTOR_STORE_MODE"] = "memory"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import keyword_index
+import retrieval
+import vector_store
+from embeddings import embed_documents
+
+FILLER = ("Queen toured Europe and recorded at Rockfield Studios while Freddie Mercury Brian May "
+          "Roger Taylor and John Deacon wrote songs for the band during long sessions").split()
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ne", "su", "vi", "da", "pe", "zo", "qui"]
+
+
+def album_title(rng):
+    return " ".join(
+        "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize() for _ in range(2)
+    )
+
+
+def make_corpus(n_chunks, seed=0):
+    rng = random.Random(seed)
+    chunks, facts = [], []
+    for i in range(n_chunks):
+        title, year = album_title(rng), rng.randint(1970, 1995)
+        filler = " ".join(rng.choice(FILLER) for _ in range(90))
+        chunks.append(f"{filler} The album {title} was released in {year}. {filler}")
+        facts.append((f"chunk_{i}", title, year))
+    return chunks, facts
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--index-chunks", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks, facts = make_corpus(args.chunks)
+    collection = vector_store.reset_collection("bench_hybrid")
+    vectors = embed_documents(chunks)
+    batch = 5000
+    for start in range(0, len(chunks), batch):
+        collection.add(
+            ids=[f"chunk_{i}" for i in range(start, min(start + batch, len(chunks)))],
+            embeddings=vectors[start:start + batch].tolist(),
+            documents=chunks[start:start + batch],
+            metadatas=[{"filename": "bench.md"} for _ in chunks[start:start + batch]],
+        )
+    keyword_index.get_keyword_index(collection)  # build outside the timings
+
+    queries = random.Random(1).sample(facts, min(args.queries, len(facts)))
+    modes = {
+        "vector": lambda q: retrieval.retrieve(collection, q, args.k, hybrid=False).ids,
+        "keyword": lambda q: [i for i, _ in keyword_index.get_keyword_index(collection).search(q, args.k)],
+        "hybrid": lambda q: retrieval.retrieve(collection, q, args.k, hybrid=True).ids,
+    }
+
+    print(f"{args.chunks} chunks, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':>8} {'recall@k':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for mode, search in modes.items():
+        hits, latencies = 0, []
+        for chunk_id, title, _ in queries:
+            start = time.perf_counter()
+            ids = search(f"When was {title} released?")
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += chunk_id in ids
+        print(f"{mode:>8} {hits / len(queries):>9.2f} {percentile(latencies, 50):>7.2f} "
+              f"{percentile(latencies, 95):>7.2f}")
+
+    if args.index_chunks:
+        big_chunks, big_facts = make_corpus(args.index_chunks, seed=2)
+        index = keyword_index.KeywordIndex()
+        start = time.perf_counter()
+        index.add([f for f, _, _ in big_facts], big_chunks)
+        build = time.perf_counter() - start
+        latencies = []
+        for _, title, year in random.Random(3).sample(big_facts, args.queries):
+            start = time.perf_counter()
+            index.search(f"{title} {year}", args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"keyword index, {args.index_chunks} chunks: built in {build:.1f}s, "
+              f"p50 {percentile(latencies, 50):.2f} ms, p95 {percentile(latencies, 95):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
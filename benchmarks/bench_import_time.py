@@ -0,0 +1,84 @@
+"""
+Import-time budget for the app modules.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+which reports the cumulative import time of every module. The script prints
+the total and the slowest top-level packages, and fails (exit code 1) when a
+module goes over its budget or pulls in one of the heavy libraries that
+should only be imported on first use. Run it after changing imports.
+
+Usage: python benchmarks/bench_import_time.py [--budget-ms 1500] [--runs 3] [--top 8]
+       [--modules final_app ConversionApp]
+
+app.py is left out: it is a script that builds its collection while importing.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Imported lazily by conversion.py, models.py, embeddings.py, rerank.py and ingest.py
+HEAVY = ("docling", "transformers", "torch", "sentence_transformers", "langchain", "langchain_text_splitters")
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(module):
+    """{module: cumulative microseconds} for one import of `module` in a new process"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def top_level(times):
+    """Cumulative time per top-level package (outermost entries only)"""
+    packages = {}
+    for name, micros in times.items():
+        root = name.split(".")[0]
+        packages[root] = max(packages.get(root, 0), micros)
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=["final_app", "ConversionApp"])
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run counts (first one warms the disk cache)")
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        times = min(runs, key=lambda t: t.get(module, 0))
+        total_ms = times.get(module, 0) / 1000
+        heavy = sorted({name.split(".")[0] for name in times} & set(HEAVY))
+        over = total_ms > args.budget_ms
+        status = "OVER BUDGET" if over else "ok"
+        print(f"{module}: {total_ms:,.0f} ms (budget {args.budget_ms:,.0f} ms) {status}")
+        if heavy:
+            print(f"  imports heavy libraries at start-up: {', '.join(heavy)}")
+        packages = sorted(top_level(times).items(), key=lambda item: -item[1])
+        for name, micros in packages[:args.top]:
+            print(f"  {micros / 1000:8.1f} ms  {name}")
+        failed = failed or over or bool(heavy)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
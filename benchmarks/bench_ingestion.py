@@ -0,0 +1,83 @@
+"""
+Ingestion throughput (chunks/sec): per-chunk encode + add vs. bulk ingestion.
+
+Synthetic markdown documents are ingested into a throw-away in-memory store,
+first one file at a time with the old per-chunk loop, then with the bulk path
+(chunks batched across all files). Both split the documents with the same
+chunker (ingest.chunk_text, chosen by CHUNKER).
+
+Usage: python benchmarks/bench_ingestion.py [--files 1 10] [--words 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+os.environ["VECTOR_STORE_MODE"] = "memory"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import embeddings
+import ingest
+import vector_store
+
+WORDS = ("Queen released A Night at the Opera in 1975 and Freddie Mercury Brian May "
+         "Roger Taylor John Deacon recorded Bohemian Rhapsody at Rockfield Studios").split()
+
+
+def make_docs(n_files, n_words, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for f in range(n_files):
+        paragraphs = []
+        for _ in range(n_words // 60):
+            paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(60)))
+        docs.append({'filename': f"bench_{f}.md", 'content': "\n\n".join(paragraphs)})
+    return docs
+
+
+def per_chunk(docs, collection_name):
+    """The original add_text_to_chromadb loop: one encode and one add per chunk"""
+    collection = vector_store.get_collection(collection_name)
+    model = embeddings.get_embedding_model()
+    total = 0
+    for doc in docs:
+        for i, chunk in enumerate(c.text for c in ingest.chunk_text(doc['content'])):
+            collection.add(
+                embeddings=[model.encode(chunk).tolist()],
+                documents=[chunk],
+                metadatas=[{"filename": doc['filename'], "chunk_index": i, "chunk_size": len(chunk)}],
+                ids=[f"{doc['filename']}_chunk_{i}"]
+            )
+            total += 1
+    return total
+
+
+def bulk(docs, collection_name):
+    stats = ingest.add_documents(docs, collection_name)
+    return stats["chunks_embedded"] + stats["chunks_reused"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--words", type=int, default=5000)
+    args = parser.parse_args()
+
+    embeddings.get_embedding_model()  # load the model outside the timings
+
+    print(f"{'files':>6} {'mode':>10} {'chunks':>7} {'seconds':>8} {'chunks/s':>9}")
+    for n_files in args.files:
+        docs = make_docs(n_files, args.words)
+        for mode, fn in (("per-chunk", per_chunk), ("bulk", bulk)):
+            name = f"bench_{mode}_{n_files}"
+            vector_store.reset_collection(name)
+            start = time.perf_counter()
+            chunks = fn(docs, name)
+            elapsed = time.perf_counter() - start
+            print(f"{n_files:>6} {mode:>10} {chunks:>7} {elapsed:>8.2f} {chunks / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Per-stage cost of building the answer prompt, with and without reranking.
+
+Runs qa.build_prompt_with_source (retrieval, optional cross-encoder rerank,
+prompt packing; no generation) for a set of questions and prints p50/p95
+milliseconds for every stage, plus how often the reranker made its budget.
+
+Needs a populated "documents" collection (upload some files in final_app.py first).
+
+Usage: python benchmarks/bench_rerank.py [--rounds 5] [--budget-ms 150] [--candidates 20]
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+QUESTIONS = [
+    "What albums did Queen release in the 1980s?",
+    "Who was the lead singer of Queen?",
+    "When did Queen form?",
+    "Which song did John Deacon write?",
+    "What awards did Queen win?",
+    "What guitar did Brian May play?",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def run(qa, collection, rounds):
+    stages, statuses = {}, Counter()
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            info = {}
+            qa.build_prompt_with_source(collection, question, info)
+            for stage, ms in info.get("timings", {}).items():
+                stages.setdefault(stage, []).append(ms)
+            if "rerank" in info:
+                statuses[info["rerank"]] += 1
+    return stages, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--candidates", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.budget_ms is not None:
+        os.environ["RERANK_BUDGET_MS"] = str(args.budget_ms)
+    if args.candidates:
+        os.environ["RERANK_CANDIDATES"] = str(args.candidates)
+
+    import qa
+    import rerank
+    import vector_store
+
+    collection = vector_store.get_collection("documents")
+    if not collection.count():
+        print("The 'documents' collection is empty; upload documents first.")
+        sys.exit(1)
+
+    rerank.get_reranker()  # load outside the timings
+    for enabled in (False, True):
+        qa.RERANK_ENABLED = enabled
+        qa.RERANK_CANDIDATES = rerank.RERANK_CANDIDATES
+        run(qa, collection, 1)  # warm-up
+        stages, statuses = run(qa, collection, args.rounds)
+        print(f"rerank {'on' if enabled else 'off'}"
+              + (f" (budget {rerank.RERANK_BUDGET_MS:.0f} ms, {rerank.RERANK_CANDIDATES} candidates): "
+                 f"{dict(statuses)}" if enabled else ""))
+        print(f"{'stage':>10} {'p50 ms':>8} {'p95 ms':>8}")
+        for stage, values in stages.items():
+            print(f"{stage[:-3]:>10} {percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
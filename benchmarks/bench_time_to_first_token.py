@@ -0,0 +1,59 @@
+"""
+Time to first token vs. total answer time, for streamed and non-streamed generation.
+
+"blocking" is what the Ask tab did before: nothing is shown until
+models.generate_text returns, so the first word appears after the whole answer.
+"streaming" uses models.stream_text, where the first word can be shown as soon
+as the model produces it.
+
+Usage: python benchmarks/bench_time_to_first_token.py [--runs 5]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PROMPT = """Context information:
+Document 1: Queen's debut album, Queen (1973), introduced them as a force in hard rock. In the 1980s they released The Game (1980), Hot Space (1982), The Works (1984), A Kind of Magic (1986) and The Miracle (1989).
+
+Question: What albums did Queen release in the 1980s?
+
+Answer:"""
+
+
+def blocking(models):
+    start = time.perf_counter()
+    models.generate_text(PROMPT, max_length=150)
+    total = time.perf_counter() - start
+    return total, total
+
+
+def streaming(models):
+    start = time.perf_counter()
+    first = None
+    for _ in models.stream_text(PROMPT, max_length=150):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import models
+
+    models.generate_text(PROMPT, max_length=150)  # load the model outside the timings
+
+    print(f"{'mode':>10} {'first token ms':>15} {'total ms':>9}")
+    for mode, fn in (("blocking", blocking), ("streaming", streaming)):
+        firsts, totals = zip(*(fn(models) for _ in range(args.runs)))
+        print(f"{mode:>10} {statistics.median(firsts) * 1000:>15.0f} {statistics.median(totals) * 1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold-start time of the persistent vector store with a large corpus.
+
+The first run fills a store in --path with --chunks random 384-d chunks (the
+size of all-MiniLM-L6-v2 vectors); later runs reuse it. Each measurement runs
+in a fresh Python process so nothing is cached in memory.
+
+Usage: python benchmarks/bench_vector_store_cold_start.py [--chunks 100000] [--path bench_chroma]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+OPEN_SNIPPET = """
+import os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import vector_store
+imported = time.perf_counter()
+collection = vector_store.get_collection("documents")
+opened = time.perf_counter()
+count = collection.count()
+counted = time.perf_counter()
+collection.query(query_embeddings=[[0.1] * 384], n_results=3)
+queried = time.perf_counter()
+print(f"{{count}} {{(imported - start) * 1000:.0f}} {{(opened - imported) * 1000:.1f}} "
+      f"{{(counted - opened) * 1000:.1f}} {{(queried - counted) * 1000:.1f}}")
+"""
+
+
+def fill(path, chunks, batch=5000):
+    import random
+
+    os.environ["CHROMA_PERSIST_DIR"] = path
+    sys.path.insert(0, str(ROOT))
+    import vector_store
+
+    collection = vector_store.get_collection("documents")
+    have = collection.count()
+    if have >= chunks:
+        return
+    print(f"filling {path} with {chunks - have} chunks...")
+    rng = random.Random(0)
+    for start in range(have, chunks, batch):
+        end = min(start + batch, chunks)
+        collection.add(
+            ids=[f"bench_{i}" for i in range(start, end)],
+            embeddings=[[rng.uniform(-1, 1) for _ in range(384)] for _ in range(start, end)],
+            documents=[f"Queen chunk number {i} about albums, tours and members." for i in range(start, end)],
+            metadatas=[{"filename": f"bench_{i // 50}.pdf", "chunk_index": i % 50} for i in range(start, end)],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--path", default="bench_chroma")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    fill(args.path, args.chunks)
+
+    env = dict(os.environ, CHROMA_PERSIST_DIR=args.path, VECTOR_STORE_MODE="persistent")
+    print(f"{'chunks':>8} {'import ms':>10} {'open ms':>8} {'count ms':>9} {'query ms':>9} {'wall s':>7}")
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", OPEN_SNIPPET.format(root=str(ROOT))],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        wall = time.perf_counter() - start
+        count, imp, opened, counted, queried = out
+        print(f"{count:>8} {imp:>10} {opened:>8} {counted:>9} {queried:>9} {wall:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
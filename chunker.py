@@ -0,0 +1,212 @@
+"""
+Structure-aware chunking of converted documents.
+
+The recursive character splitter cuts the exported markdown every ~700
+characters wherever it happens to be, so sections run into each other and
+tables are cut mid-row. Here documents are read as a stream of blocks
+(headings, paragraphs, lists, tables) and packed into chunks that:
+
+- start a new chunk at a section boundary (unless the chunk so far is tiny),
+- keep tables whole, or split them by rows with the header row repeated,
+- split long paragraphs at sentence ends, with CHUNK_OVERLAP of overlap,
+- carry the path of headings they sit under ("Discography > 1980s").
+
+Blocks are read from the converted markdown line by line
+(iter_markdown_blocks). Everything is a generator, so chunks can be embedded
+while the rest of the document is still being read:
+
+    for chunk in chunk_markdown(open("queen.md", encoding="utf-8")):
+        chunk.text, chunk.heading
+"""
+import os
+import re
+from collections import namedtuple
+
+
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "700"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "100"))
+# A section shorter than this is merged into the next chunk instead of standing alone
+MIN_CHUNK_SIZE = int(os.environ.get("MIN_CHUNK_SIZE", "200"))
+
+# `heading` is the heading path joined with " > " ("" before the first heading)
+Chunk = namedtuple("Chunk", "text heading")
+
+# A block is (kind, text, level); level is only used for headings
+Block = namedtuple("Block", "kind text level")
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_ITEM = re.compile(r"^\s*([-*+]|\d+[.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+# ---------------------------------------------------------------------------
+# Blocks
+# ---------------------------------------------------------------------------
+
+def iter_markdown_blocks(lines):
+    """Blocks of markdown read line by line (any iterable of lines)"""
+    kind, buffer = None, []
+
+    def block():
+        return Block(kind, "\n".join(buffer).strip(), 0)
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+
+        if kind == "code":
+            buffer.append(line)
+            if stripped.startswith("```"):
+                yield block()
+                kind, buffer = None, []
+            continue
+
+        if stripped.startswith("```"):
+            line_kind = "code"
+        elif not stripped:
+            line_kind = None
+        elif _HEADING.match(stripped):
+            line_kind = "heading"
+        elif stripped.startswith("|"):
+            line_kind = "table"
+        elif _LIST_ITEM.match(line) or (kind == "list" and line[:1].isspace()):
+            line_kind = "list"
+        else:
+            line_kind = "paragraph"
+
+        if buffer and (line_kind != kind or line_kind == "heading"):
+            yield block()
+            buffer = []
+        if line_kind == "heading":
+            match = _HEADING.match(stripped)
+            yield Block("heading", match.group(2), len(match.group(1)))
+            kind = None
+            continue
+        kind = line_kind
+        if kind is not None:
+            buffer.append(line)
+
+    if buffer:
+        yield block()
+
+
+# ---------------------------------------------------------------------------
+# Packing blocks into chunks
+# ---------------------------------------------------------------------------
+
+def _split_table(text, size):
+    """Row groups of a markdown table, each starting with the header rows"""
+    lines = text.splitlines()
+    header, rows = lines[:2], lines[2:]
+    header_size = sum(len(line) + 1 for line in header)
+    piece, piece_size = [], header_size
+    for row in rows:
+        if piece and piece_size + len(row) + 1 > size:
+            yield "\n".join(header + piece)
+            piece, piece_size = [], header_size
+        piece.append(row)
+        piece_size += len(row) + 1
+    if piece or not rows:
+        yield "\n".join(header + piece)
+
+
+def _split_text(text, size, overlap, separator=_SENTENCE_END, joiner=" "):
+    """Pieces of at most `size` characters, cut at sentence ends (or words, or anywhere), overlapping"""
+    units = [u for u in separator.split(text) if u]
+    if separator is _SENTENCE_END and any(len(u) > size for u in units):
+        units = [w for u in units for w in (u.split() if len(u) > size else [u])]
+    if any(len(u) > size for u in units):
+        # a single word or line longer than a chunk (URLs, base64, ...): cut it every `size` characters
+        units = [u[i:i + size] for u in units for i in range(0, len(u), size)]
+    piece = []
+    for unit in units:
+        if piece and len(joiner.join(piece + [unit])) > size:
+            yield joiner.join(piece)
+            # carry the last units (up to `overlap` characters) into the next piece
+            carried = []
+            for previous in reversed(piece):
+                if len(joiner.join([previous] + carried)) > overlap:
+                    break
+                carried.insert(0, previous)
+            # ... as long as the next piece still fits
+            while carried and len(joiner.join(carried + [unit])) > size:
+                carried.pop(0)
+            piece = carried
+        piece.append(unit)
+    if piece:
+        yield joiner.join(piece)
+
+
+def _split_block(block, size, overlap):
+    if len(block.text) <= size:
+        return [block.text]
+    if block.kind == "table":
+        return list(_split_table(block.text, size))
+    if block.kind in ("list", "code"):
+        return list(_split_text(block.text, size, 0, separator=re.compile(r"\n"), joiner="\n"))
+    return list(_split_text(block.text, size, overlap))
+
+
+def _common_path(paths):
+    common = list(paths[0])
+    for path in paths[1:]:
+        n = 0
+        while n < min(len(common), len(path)) and common[n] == path[n]:
+            n += 1
+        common = common[:n]
+    return " > ".join(title for _, title in common)
+
+
+def chunk_blocks(blocks, chunk_size: int = None, overlap: int = None, min_chunk_size: int = None):
+    """Pack a stream of blocks into Chunks (a generator)"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    min_chunk_size = MIN_CHUNK_SIZE if min_chunk_size is None else min_chunk_size
+
+    path = []                   # [(level, title), ...] of the current section
+    pieces, size, paths = [], 0, []
+    headings = 0                # heading lines at the end of `pieces` with nothing under them yet
+
+    for block in blocks:
+        if block.kind == "heading":
+            if size >= min_chunk_size:
+                yield Chunk("\n\n".join(pieces), _common_path(paths))
+                pieces, size, paths, headings = [], 0, [], 0
+            path = [p for p in path if p[0] < block.level] + [(block.level, block.text)]
+            # the heading line opens the section's first chunk
+            line = "#" * min(block.level, 6) + " " + block.text
+            pieces.append(line)
+            size += len(line) + 2
+            paths.append(tuple(path))
+            headings += 1
+            continue
+        if not block.text:
+            continue
+
+        # Leave room for pending headings, so they can move along with their section
+        heading_size = sum(len(piece) + 2 for piece in pieces[len(pieces) - headings:])
+        for piece in _split_block(block, max(chunk_size // 2, chunk_size - heading_size), overlap):
+            if pieces and size + len(piece) + 2 > chunk_size:
+                # Pending headings start the next chunk instead of ending this one
+                keep = len(pieces) - headings
+                if keep:
+                    yield Chunk("\n\n".join(pieces[:keep]), _common_path(paths[:keep]))
+                    pieces, paths = pieces[keep:], paths[keep:]
+                    size = sum(len(p) + 2 for p in pieces)
+                if size + len(piece) + 2 > chunk_size:
+                    yield Chunk("\n\n".join(pieces), _common_path(paths))
+                    pieces, size, paths = [], 0, []
+            pieces.append(piece)
+            size += len(piece) + 2
+            paths.append(tuple(path))
+            headings = 0
+
+    if pieces:
+        yield Chunk("\n\n".join(pieces), _common_path(paths))
+
+
+def chunk_markdown(text_or_lines, **options):
+    """Chunks of markdown, given as one string or an iterable of lines"""
+    lines = text_or_lines.splitlines() if isinstance(text_or_lines, str) else text_or_lines
+    return chunk_blocks(iter_markdown_blocks(lines), **options)
+
@@ -0,0 +1,495 @@
+"""
+Shared document conversion helpers used by ConversionApp.py and final_app.py.
+
+Building a docling DocumentConverter loads the layout and table models, so we
+keep a small pool of converters per process instead of creating one per file.
+Streamlit re-runs the app script on every interaction but imported modules stay
+loaded, so the pool below is shared by every rerun and every session.
+
+Converted markdown is also cached on disk, so a file that was converted before
+(in any session, or before a restart) comes back without running docling.
+
+docling itself is only imported when the first converter is built, so apps
+that import this module start quickly.
+"""
+import hashlib
+import importlib.metadata
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+
+from telemetry import record, trace
+
+
+# How many converters may exist for the same format/options at once.
+# Each one holds its own copy of the models, so keep this small.
+CONVERTER_POOL_SIZE = int(os.environ.get("CONVERTER_POOL_SIZE", "2"))
+
+# Default PDF pipeline settings (same values the apps always used)
+PDF_NUM_THREADS = 4
+PDF_DO_OCR = False
+
+# Default number of worker processes for batch conversion
+CONVERSION_WORKERS = int(os.environ.get("CONVERSION_WORKERS", str(os.cpu_count() or 1)))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _ConverterPool:
+    """A bounded pool of identical converters for one format/options key"""
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = max(1, size)
+        self.created = 0
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Reuse an idle converter if there is one
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Otherwise build a new one, as long as we are under the size cap
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if can_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+
+        # Pool is full: wait for another session to hand one back
+        return self.idle.get()
+
+    def release(self, converter):
+        self.idle.put(converter)
+
+
+def _pdf_converter_factory(do_ocr, num_threads, device):
+    def build():
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+        from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions
+
+        pdf_opts = PdfPipelineOptions(do_ocr=do_ocr)
+        pdf_opts.accelerator_options = AcceleratorOptions(
+            num_threads=num_threads,
+            device=device
+        )
+        return DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(
+                    pipeline_options=pdf_opts,
+                    backend=DoclingParseV2DocumentBackend
+                )
+            }
+        )
+    return build
+
+
+def _docx_converter():
+    from docling.document_converter import DocumentConverter
+    return DocumentConverter()
+
+
+def _get_pool(key, factory):
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _ConverterPool(factory, CONVERTER_POOL_SIZE)
+            _pools[key] = pool
+        return pool
+
+
+def _pool_for(fmt: str, do_ocr: bool = None, num_threads: int = None, device=None):
+    """Return the converter pool for a format and its pipeline options"""
+    if fmt == "pdf":
+        do_ocr = PDF_DO_OCR if do_ocr is None else do_ocr
+        num_threads = PDF_NUM_THREADS if num_threads is None else num_threads
+        if device is None:
+            from docling.datamodel.pipeline_options import AcceleratorDevice
+            device = AcceleratorDevice.CPU
+        key = ("pdf", do_ocr, num_threads, str(device))
+        return _get_pool(key, _pdf_converter_factory(do_ocr, num_threads, device))
+    if fmt == "docx":
+        return _get_pool(("docx",), _docx_converter)
+    raise ValueError(f"No converter for format: {fmt}")
+
+
+@contextmanager
+def pooled_converter(fmt: str, **options):
+    """
+    Borrow a converter for `fmt` ("pdf" or "docx") from the process-wide pool.
+    The converter goes back to the pool when the with-block ends, so two
+    sessions never run the same converter at the same time.
+    """
+    pool = _pool_for(fmt, **options)
+    converter = pool.acquire()
+    try:
+        yield converter
+    finally:
+        pool.release(converter)
+
+
+def warm_converters(formats=("pdf", "docx")):
+    """
+    Build one converter per format and load its models ahead of time,
+    so the first uploaded file does not pay the model start-up cost.
+    Calling this again is cheap: already warm pools are left alone.
+    Warming is best effort: a failure is printed and shows up again on the
+    first real conversion instead of stopping the app.
+    """
+    from docling.datamodel.base_models import InputFormat
+
+    input_formats = {"pdf": InputFormat.PDF, "docx": InputFormat.DOCX}
+    for fmt in formats:
+        pool = _pool_for(fmt)
+        if pool.created:
+            continue
+        try:
+            with pooled_converter(fmt) as converter:
+                converter.initialize_pipeline(input_formats[fmt])
+        except Exception as e:
+            print(f"Could not warm up the {fmt} converter: {e}")
+
+
+def converter_pool_info():
+    """Return {key: number of converters built} for every pool in this process"""
+    with _pools_lock:
+        return {key: pool.created for key, pool in _pools.items()}
+
+
+# ---------------------------------------------------------------------------
+# On-disk conversion cache
+# ---------------------------------------------------------------------------
+
+# Converted markdown is kept here, keyed by file content, format, options and docling version
+CONVERSION_CACHE_DIR = os.environ.get("CONVERSION_CACHE_DIR", ".conversion_cache")
+# Least recently used entries are removed once the cache grows past this size
+CONVERSION_CACHE_MAX_MB = float(os.environ.get("CONVERSION_CACHE_MAX_MB", "1024"))
+
+_cache_lock = threading.Lock()
+_cache_bytes = None          # approximate size of the cache dir, scanned on first write
+_cache_counters = {"hits": 0, "misses": 0}
+
+
+def _docling_version():
+    try:
+        return importlib.metadata.version("docling")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def file_hash(file_path: str) -> str:
+    """sha256 of a file's content, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_key(file_path: str, fmt: str) -> str:
+    if fmt == "pdf":
+        options = f"ocr={PDF_DO_OCR};backend=DoclingParseV2"
+    else:
+        options = "default"
+    parts = [file_hash(file_path), fmt, options, "image_mode=placeholder", _docling_version()]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return Path(CONVERSION_CACHE_DIR) / key[:2] / f"{key}.md"
+
+
+def _cache_get(key: str):
+    path = _cache_path(key)
+    try:
+        markdown = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    # Touch the file so eviction sees it as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return markdown
+
+
+def _cache_put(key: str, markdown: str):
+    """Write atomically: a temp file in the same directory, then os.replace"""
+    global _cache_bytes
+    path = _cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(markdown)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = _scan_cache()[1]
+        else:
+            _cache_bytes += path.stat().st_size
+        if _cache_bytes > CONVERSION_CACHE_MAX_MB * 1024 * 1024:
+            _evict_cache()
+
+
+def _scan_cache():
+    """Return ([(mtime, size, path), ...], total_bytes) for every cached entry"""
+    entries = []
+    total = 0
+    for path in Path(CONVERSION_CACHE_DIR).glob("*/*.md"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # removed by another process
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    return entries, total
+
+
+def _evict_cache():
+    """Remove least recently used entries until the cache is below 90% of its cap"""
+    global _cache_bytes
+    entries, total = _scan_cache()
+    target = CONVERSION_CACHE_MAX_MB * 1024 * 1024 * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+    _cache_bytes = total
+
+
+def conversion_cache_stats():
+    """Hit/miss counters for this process plus the size of the cache on disk"""
+    entries, total = _scan_cache()
+    with _cache_lock:
+        counters = dict(_cache_counters)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        **counters,
+        "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+        "entries": len(entries),
+        "size_mb": round(total / 1024 / 1024, 1),
+    }
+
+
+def _count_lookup(cached: bool):
+    with _cache_lock:
+        _cache_counters["hits" if cached else "misses"] += 1
+
+
+# ---------------------------------------------------------------------------
+# Conversion
+# ---------------------------------------------------------------------------
+
+def _docling_to_markdown(file_path: str, fmt: str) -> str:
+    with pooled_converter(fmt) as converter:
+        doc = converter.convert(file_path).document
+    return doc.export_to_markdown(image_mode="placeholder")
+
+
+def _convert_with_cache(file_path: str):
+    """Return (markdown, came_from_cache) for a file"""
+    path = Path(file_path)
+    ext = path.suffix.lower()
+
+    if ext == ".txt":
+        try:
+            return path.read_text(encoding="utf-8"), False
+        except UnicodeDecodeError:
+            return path.read_text(encoding="latin-1", errors="replace"), False
+
+    if ext == ".pdf":
+        fmt = "pdf"
+    elif ext in [".doc", ".docx"]:
+        fmt = "docx"
+    else:
+        raise ValueError(f"Unsupported extension: {ext}")
+
+    key = _cache_key(file_path, fmt)
+    markdown = _cache_get(key)
+    _count_lookup(markdown is not None)
+    if markdown is not None:
+        return markdown, True
+
+    markdown = _docling_to_markdown(file_path, fmt)
+    _cache_put(key, markdown)
+    return markdown, False
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None
+
+
+def convert_to_markdown(file_path: str) -> str:
+    with trace("convert", size=_file_size(file_path)) as span:
+        markdown, span.cache_hit = _convert_with_cache(file_path)
+    return markdown
+
+
+# ---------------------------------------------------------------------------
+# Batch conversion
+# ---------------------------------------------------------------------------
+
+ConversionResult = namedtuple("ConversionResult", ["path", "markdown", "error", "seconds", "cached"])
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+_started = None             # the executor (or "in-process") start_conversion_workers warmed
+
+
+def _worker_init(num_threads):
+    """Runs once in every worker process: split the CPU between workers and warm up"""
+    global PDF_NUM_THREADS
+    PDF_NUM_THREADS = num_threads
+    warm_converters()
+
+
+def _convert_one(file_path):
+    start = time.perf_counter()
+    try:
+        markdown, cached = _convert_with_cache(file_path)
+        return ConversionResult(file_path, markdown, None, time.perf_counter() - start, cached)
+    except Exception as e:
+        return ConversionResult(file_path, None, f"{type(e).__name__}: {e}", time.perf_counter() - start, False)
+
+
+def _get_executor(workers):
+    """
+    Return the process pool for `workers` workers. The pool is kept between
+    batches of any size so the workers (and the converters they loaded) stay
+    warm; it is only rebuilt if a different worker count is asked for.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                # Files already submitted by other sessions still finish
+                _executor.shutdown(wait=False)
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(threads,)
+            )
+            _executor_workers = workers
+        return _executor
+
+
+def _drop_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def start_conversion_workers(workers: int = None):
+    """
+    Start the conversion workers now, so the first batch does not pay for
+    starting them and loading their models. Returns at once: each worker warms
+    up in its own process (with workers=1 the converters of this process are
+    warmed on a background thread). Calling it again is cheap.
+    """
+    global _started
+    workers = max(1, CONVERSION_WORKERS if workers is None else workers)
+    if workers == 1:
+        with _executor_lock:
+            if _started == "in-process":
+                return
+            _started = "in-process"
+        threading.Thread(target=warm_converters, daemon=True, name="warm-converters").start()
+        return
+    executor = _get_executor(workers)
+    with _executor_lock:
+        if _started is executor:
+            return
+        _started = executor
+    # One task per worker; each starts a process, which runs _worker_init first
+    for _ in range(workers):
+        executor.submit(_worker_ready)
+
+
+def _record_conversion(result):
+    """Conversions in worker processes are timed there; record them in this process"""
+    record("convert", result.seconds, size=_file_size(result.path),
+           cache_hit=result.cached if result.error is None else None, error=result.error is not None)
+    return result
+
+
+def convert_batch(file_paths, workers: int = None):
+    """
+    Convert many files and yield a ConversionResult for each one as soon as it
+    finishes (completion order, not input order). A file that fails to convert
+    gives a result with `error` set; the rest of the batch keeps going.
+
+    With workers=1 or only .txt files, everything runs in this process using
+    the shared converter pool; otherwise files (a single one too) are spread
+    over the process-wide pool of `workers` worker processes, which is the
+    same size for every batch, so the models are only loaded by the workers.
+    Call start_conversion_workers() at start-up to have them warm already.
+    """
+    file_paths = list(file_paths)
+    workers = max(1, CONVERSION_WORKERS if workers is None else workers)
+    only_text = all(Path(path).suffix.lower() == ".txt" for path in file_paths)
+
+    if workers == 1 or only_text:
+        for file_path in file_paths:
+            yield _record_conversion(_convert_one(file_path))
+        return
+
+    executor = _get_executor(workers)
+    futures = {executor.submit(_convert_one, path): path for path in file_paths}
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); report it and start fresh next time
+            _drop_executor(executor)
+            result = ConversionResult(futures[future], None, f"Worker crashed: {e}", 0.0, False)
+        except Exception as e:
+            result = ConversionResult(futures[future], None, f"{type(e).__name__}: {e}", 0.0, False)
+        # workers keep their own counters; mirror cache lookups here so the stats are complete
+        # (a failed conversion was looked up and missed, too)
+        if Path(result.path).suffix.lower() in (".pdf", ".doc", ".docx"):
+            _count_lookup(result.cached)
+        yield _record_conversion(result)
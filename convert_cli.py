@@ -0,0 +1,224 @@
+"""
+Convert folders of documents to markdown from the command line, without the UI.
+
+    python convert_cli.py docs/ "scans/**/*.pdf" --out markdown/ --workers 4
+
+Every input file becomes <out>/<path relative to its input>.md. Files are
+converted by the same code as the apps (conversion.convert_batch, i.e.
+convert_to_markdown spread over worker processes, with the shared on-disk
+conversion cache).
+
+Progress is appended to <out>/manifest.jsonl after every file. Running the
+same command again (e.g. after Ctrl-C or a crash) skips files whose output is
+up to date: the source has the same size and modification time as when it was
+converted, and its output path is unchanged and still there. Files that would
+get the same output (queen.pdf and queen.docx) keep their extension:
+queen.pdf.md and queen.docx.md. Failed files are tried again. Use
+--force to convert everything.
+
+At the end the run prints how long the slowest files took and the overall
+throughput; per-file timings are kept in the manifest.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from conversion import CONVERSION_WORKERS, convert_batch
+
+
+SUPPORTED_EXTENSIONS = {".pdf", ".doc", ".docx", ".txt"}
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def _glob_base(pattern: str) -> Path:
+    """The leading part of a glob pattern without wildcards"""
+    parts = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def find_inputs(inputs):
+    """[(source path, path relative to its input), ...] of the supported files"""
+    found, seen = [], set()
+
+    def add(path, base):
+        path = Path(path)
+        if not path.is_file() or path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            return
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            found.append((path, path.relative_to(base) if base else Path(path.name)))
+
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            for child in sorted(path.rglob("*")):
+                add(child, path)
+        elif path.is_file():
+            add(path, None)
+        else:
+            base = _glob_base(item)
+            for match in sorted(glob.glob(item, recursive=True)):
+                add(match, base)
+    return found
+
+
+def _signature(path: Path):
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_manifest(path: Path):
+    """The latest entry per source file of an earlier run"""
+    entries = {}
+    if not path.exists():
+        return entries
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run may be cut off
+                continue
+            entries[entry["source"]] = entry
+    return entries
+
+
+def _up_to_date(entry, signature, output: Path):
+    return (
+        entry is not None
+        and entry.get("status") == "ok"
+        and entry.get("size") == signature["size"]
+        and entry.get("mtime_ns") == signature["mtime_ns"]
+        and entry.get("output") == str(output.resolve())
+        and output.exists()
+    )
+
+
+def _output_paths(found, out_dir: Path):
+    """
+    {source: output path}. Files whose outputs would collide (queen.pdf and
+    queen.docx side by side) all keep their extension, whatever the order of
+    the inputs: queen.pdf.md and queen.docx.md.
+    """
+    counts = {}
+    for _, relative in found:
+        output = relative.with_suffix(".md")
+        counts[output] = counts.get(output, 0) + 1
+    outputs = {}
+    for source, relative in found:
+        output = relative.with_suffix(".md")
+        if counts[output] > 1:
+            output = relative.with_name(relative.name + ".md")
+        outputs[source] = out_dir / output
+    return outputs
+
+
+def _write_output(output: Path, markdown: str):
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.name + ".tmp")
+    tmp.write_text(markdown, encoding="utf-8")
+    os.replace(tmp, output)
+
+
+def run(inputs, out_dir, workers: int = None, force: bool = False, quiet: bool = False):
+    """Convert everything under `inputs` into `out_dir`; returns a summary dict"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    previous = {} if force else load_manifest(manifest_path)
+
+    todo, outputs, signatures, skipped = [], {}, {}, 0
+    found = find_inputs(inputs)
+    planned = _output_paths(found, out_dir)
+    for source, _ in found:
+        key = str(source.resolve())
+        output = planned[source]
+        signature = _signature(source)
+        if _up_to_date(previous.get(key), signature, output):
+            skipped += 1
+            continue
+        todo.append(str(source))
+        outputs[str(source)] = output
+        signatures[str(source)] = signature
+
+    if not quiet:
+        print(f"{len(todo)} files to convert, {skipped} already up to date")
+
+    summary = {"converted": 0, "cached": 0, "failed": 0, "skipped": skipped,
+               "bytes": 0, "seconds": 0.0, "timings": []}
+    start = time.perf_counter()
+    with manifest_path.open("a", encoding="utf-8") as manifest:
+        try:
+            for n, result in enumerate(convert_batch(todo, workers=workers), start=1):
+                output = outputs[result.path]
+                entry = {"source": str(Path(result.path).resolve()), "output": str(output.resolve()),
+                         **signatures[result.path], "seconds": round(result.seconds, 3),
+                         "cached": result.cached, "finished_at": time.time()}
+                if result.error is None:
+                    _write_output(output, result.markdown)
+                    entry["status"] = "ok"
+                    summary["converted"] += 1
+                    summary["cached"] += result.cached
+                    summary["bytes"] += signatures[result.path]["size"]
+                    note = " (cached)" if result.cached else ""
+                else:
+                    entry["status"] = "failed"
+                    entry["error"] = result.error
+                    summary["failed"] += 1
+                    note = f" FAILED: {result.error}"
+                summary["timings"].append((result.seconds, result.path))
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+                if not quiet:
+                    print(f"[{n}/{len(todo)}] {result.path} {result.seconds:.2f} s{note}")
+        except KeyboardInterrupt:
+            summary["interrupted"] = True
+            if not quiet:
+                print("\nInterrupted; run the same command again to continue.")
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def print_summary(summary, slowest: int = 5):
+    elapsed = summary["seconds"]
+    done = summary["converted"] + summary["failed"]
+    print(
+        f"\nConverted {summary['converted']} files ({summary['cached']} from the cache), "
+        f"{summary['failed']} failed, {summary['skipped']} skipped in {elapsed:.1f} s"
+    )
+    if done and elapsed > 0:
+        print(f"Throughput: {done / elapsed * 60:.1f} files/min, "
+              f"{summary['bytes'] / 2 ** 20 / elapsed:.2f} MB/s of source documents")
+    timings = sorted(summary["timings"], reverse=True)[:slowest]
+    if timings:
+        print("Slowest files:")
+        for seconds, path in timings:
+            print(f"  {seconds:8.2f} s  {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PDF/DOC/DOCX/TXT files to markdown")
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns (quote them)")
+    parser.add_argument("--out", required=True, help="output directory (also holds the manifest)")
+    parser.add_argument("--workers", type=int, default=CONVERSION_WORKERS,
+                        help="number of worker processes used for conversion")
+    parser.add_argument("--force", action="store_true", help="convert files even if their output is up to date")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    summary = run(args.inputs, args.out, workers=args.workers, force=args.force, quiet=args.quiet)
+    print_summary(summary)
+    return 1 if summary["failed"] or summary.get("interrupted") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
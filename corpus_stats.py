@@ -0,0 +1,174 @@
+"""
+Running totals about the chunks of a collection, for the Stats tab.
+
+Counting words by splitting every document again on each Streamlit rerun cost
+time in proportion to the whole archive. Instead, ingest.py stores the word
+and token count of every chunk in its metadata, and this index keeps totals
+per document and per file extension as chunks are written or deleted, so
+reading them takes constant time:
+
+    stats = get_corpus_stats(collection)
+    stats.summary()       # {'documents': 12, 'chunks': 840, 'words': ..., 'tokens': ..., 'by_extension': {...}}
+    stats.document("queen.pdf")
+
+Like the keyword index there is one per collection and process, built from the
+chunk metadata in Chroma on first use and then kept up to date by ingest.py
+and vector_store.py. Chunks stored before their counts were recorded have
+their words counted from the text while building and 0 tokens (`uncounted`);
+uploading the document again fills them in.
+
+Words are counted per chunk, so the few words that overlapping chunks share
+are counted twice.
+"""
+import threading
+from pathlib import Path
+
+
+_indexes = {}
+_embedding_counts = {}      # collection name -> {"embedded": n, "reused": n} in this process
+_lock = threading.Lock()
+
+
+def _zero():
+    return {"documents": 0, "chunks": 0, "words": 0, "tokens": 0}
+
+
+class CorpusStats:
+    """Totals over the chunks of one collection; safe to use from several threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chunks = {}           # chunk id -> (filename, words, tokens)
+        self._documents = {}        # filename -> {"chunks", "words", "tokens", "doc_hash"}
+        self._extensions = {}       # ".pdf" -> {"documents", "chunks", "words", "tokens"}
+        self._totals = _zero()
+        self.uncounted = 0          # chunks without a token count
+
+    def _bump(self, filename, chunks, words, tokens, doc_hash=None):
+        doc = self._documents.get(filename)
+        if doc is None:
+            doc = self._documents[filename] = {"chunks": 0, "words": 0, "tokens": 0, "doc_hash": None}
+        if doc_hash:
+            doc["doc_hash"] = doc_hash
+        ext = self._extensions.setdefault(Path(filename or "").suffix.lower(), _zero())
+        documents = 0
+        if doc["chunks"] == 0 and chunks > 0:
+            documents = 1
+        elif doc["chunks"] + chunks == 0:
+            documents = -1
+        for totals in (doc, ext, self._totals):
+            totals["chunks"] += chunks
+            totals["words"] += words
+            totals["tokens"] += tokens
+        ext["documents"] += documents
+        self._totals["documents"] += documents
+        if doc["chunks"] == 0:
+            del self._documents[filename]
+
+    def _remove_locked(self, chunk_id):
+        entry = self._chunks.pop(chunk_id, None)
+        if entry is not None:
+            filename, words, tokens = entry
+            self._bump(filename, -1, -words, -(tokens or 0))
+            if tokens is None:
+                self.uncounted -= 1
+
+    def add(self, chunk_ids, metadatas, texts=None):
+        """Count chunks (again, if they were counted before) from their metadata"""
+        with self._lock:
+            for i, (chunk_id, metadata) in enumerate(zip(chunk_ids, metadatas)):
+                metadata = metadata or {}
+                self._remove_locked(chunk_id)
+                words = metadata.get("words")
+                if words is None:
+                    words = len(texts[i].split()) if texts is not None else 0
+                tokens = metadata.get("tokens")
+                filename = metadata.get("filename")
+                self._chunks[chunk_id] = (filename, words, tokens)
+                self._bump(filename, 1, words, tokens or 0, metadata.get("doc_hash"))
+                if tokens is None:
+                    self.uncounted += 1
+
+    def remove(self, chunk_ids):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove_locked(chunk_id)
+
+    def document(self, filename):
+        """{'chunks', 'words', 'tokens', 'doc_hash'} of one document (zeros if it is not stored)"""
+        with self._lock:
+            return dict(self._documents.get(filename) or {"chunks": 0, "words": 0, "tokens": 0, "doc_hash": None})
+
+    def documents(self):
+        """[{'filename', 'chunks', 'words', 'tokens', 'doc_hash'}, ...] of every stored document"""
+        with self._lock:
+            return [dict(doc, filename=filename) for filename, doc in self._documents.items()]
+
+    def summary(self):
+        """Totals, per-extension totals and chunks without a token count"""
+        with self._lock:
+            return dict(
+                self._totals,
+                by_extension={ext: dict(t) for ext, t in sorted(self._extensions.items()) if t["documents"]},
+                uncounted=self.uncounted,
+            )
+
+
+def _build(collection, batch_size: int = 5000):
+    """Count every chunk already stored in the collection"""
+    stats = CorpusStats()
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        stats.add(page["ids"], page["metadatas"])
+        # Older chunks have no word count in their metadata; count those from their text
+        missing = [id_ for id_, m in zip(page["ids"], page["metadatas"]) if "words" not in (m or {})]
+        if missing:
+            old = collection.get(ids=missing, include=["metadatas", "documents"])
+            stats.add(old["ids"], old["metadatas"], old["documents"])
+        offset += len(page["ids"])
+    return stats
+
+
+def get_corpus_stats(collection):
+    """The collection's stats index, built from its chunk metadata on first use"""
+    with _lock:
+        stats = _indexes.get(collection.name)
+        if stats is None:
+            stats = _indexes[collection.name] = _build(collection)
+        return stats
+
+
+def count_chunks(collection_name: str, chunk_ids, metadatas):
+    """Keep already built stats in step with chunks written to the collection"""
+    stats = _indexes.get(collection_name)
+    if stats is not None:
+        stats.add(chunk_ids, metadatas)
+
+
+def uncount_chunks(collection_name: str, chunk_ids):
+    """Keep already built stats in step with chunks deleted from the collection"""
+    stats = _indexes.get(collection_name)
+    if stats is not None:
+        stats.remove(chunk_ids)
+
+
+def count_embeddings(collection_name: str, embedded: int, reused: int):
+    """Record chunks that went through the embedding model or reused a stored vector"""
+    with _lock:
+        counts = _embedding_counts.setdefault(collection_name, {"embedded": 0, "reused": 0})
+        counts["embedded"] += embedded
+        counts["reused"] += reused
+
+
+def embedding_counts(collection_name: str):
+    with _lock:
+        return dict(_embedding_counts.get(collection_name) or {"embedded": 0, "reused": 0})
+
+
+def drop_corpus_stats(collection_name: str):
+    """Forget the whole index (the collection was reset)"""
+    with _lock:
+        _indexes.pop(collection_name, None)
@@ -0,0 +1,351 @@
+"""
+NumPy vector search, an alternative to Chroma's query for small/medium corpora.
+
+With RETRIEVAL_BACKEND=numpy, retrieval.py looks up the nearest chunks here
+instead of calling collection.query. Chroma stays the store of record (texts,
+metadata, persistence); this index only holds the vectors:
+
+- all embeddings are normalized and kept in one contiguous matrix, so top-k is
+  a single matrix-vector product plus argpartition;
+- DENSE_INDEX_DTYPE=float16 or int8 (per-row scale) halves or quarters the
+  memory, at a small cost in precision. Quantized rows are widened to float32
+  block by block while searching; that is cheap for int8 but slow for float16
+  in NumPy, so int8 is usually the better trade;
+- with DENSE_INDEX_DIR set, the matrix lives in a memory-mapped .npy file and
+  is reopened from there on the next start instead of being rebuilt. Writing
+  the ids and metadata costs time in proportion to the corpus, so that happens
+  at most every DENSE_INDEX_SAVE_SECONDS while chunks are written, and once
+  more when the process exits. A saved index whose chunk count no longer
+  matches the collection is rebuilt.
+
+Like the keyword index, it is built from Chroma on first use and then kept up
+to date by ingest.py and vector_store.py. Distances are squared L2 between
+normalized vectors (2 - 2 * cosine), the same scale Chroma reports for them.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "chroma")
+# "float32", "float16" or "int8"
+DENSE_INDEX_DTYPE = os.environ.get("DENSE_INDEX_DTYPE", "float32")
+# Memory-map the matrices from this directory (empty: keep them in RAM)
+DENSE_INDEX_DIR = os.environ.get("DENSE_INDEX_DIR", "")
+# Ids and metadata of a memory-mapped index are written at most this often while it changes
+DENSE_INDEX_SAVE_SECONDS = float(os.environ.get("DENSE_INDEX_SAVE_SECONDS", "30"))
+# Quantized rows are converted to float32 this many at a time while searching
+SEARCH_BLOCK_ROWS = 65536
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class DenseIndex:
+    """Normalized embeddings of one collection; safe to use from several threads"""
+
+    def __init__(self, dim: int, dtype: str = DENSE_INDEX_DTYPE, path: str = None):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported DENSE_INDEX_DTYPE '{dtype}'")
+        self.dim = dim
+        self.dtype = dtype
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._ids = []                  # slot -> chunk id (None once deleted)
+        self._slots = {}                # chunk id -> slot
+        self._filenames = {}            # filename -> code
+        self._size = 0                  # slots in use, deleted ones included
+        self._deleted = 0
+        self._matrix = self._allocate(1024)
+        self._scales = np.ones(1024, dtype=np.float32)      # int8 only
+        self._codes = np.full(1024, -1, dtype=np.int32)     # filename code per slot, -1 once deleted
+        self._dirty = False             # changed since the last save
+        self._saved_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._slots)
+
+    # -- storage -------------------------------------------------------------
+
+    def _allocate(self, capacity, old=None):
+        """A (capacity, dim) matrix holding the first rows of `old`"""
+        if self.path is None:
+            matrix = np.zeros((capacity, self.dim), dtype=self.dtype)
+            if old is not None:
+                matrix[:len(old)] = old
+            return matrix
+        # Write the bigger file next to the old one, then swap it in
+        tmp = self.path.with_suffix(".tmp.npy")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(capacity, self.dim))
+        if old is not None:
+            matrix[:len(old)] = old
+        matrix.flush()
+        os.replace(tmp, self.path)
+        return matrix
+
+    def _grow(self, needed):
+        capacity = len(self._matrix)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._matrix = self._allocate(capacity, self._matrix[:self._size])
+        self._scales = np.concatenate([self._scales, np.ones(capacity - len(self._scales), np.float32)])
+        self._codes = np.concatenate([self._codes, np.full(capacity - len(self._codes), -1, np.int32)])
+
+    def _encode(self, vectors):
+        """Rows to store (and their int8 scales) for normalized float32 vectors"""
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales
+        return vectors.astype(self.dtype), np.ones(len(vectors), np.float32)
+
+    # -- updates -------------------------------------------------------------
+
+    def add(self, chunk_ids, embeddings, metadatas):
+        """Index (or re-index) chunks with their vectors and metadata"""
+        if not len(chunk_ids):
+            return
+        rows, scales = self._encode(_normalize(embeddings))
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove_locked(chunk_id)
+            start = self._size
+            self._grow(start + len(chunk_ids))
+            end = start + len(chunk_ids)
+            self._matrix[start:end] = rows
+            self._scales[start:end] = scales
+            for i, (chunk_id, metadata) in enumerate(zip(chunk_ids, metadatas)):
+                filename = (metadata or {}).get("filename")
+                code = self._filenames.setdefault(filename, len(self._filenames))
+                self._codes[start + i] = code
+                self._ids.append(chunk_id)
+                self._slots[chunk_id] = start + i
+            self._size = end
+            self._dirty = True
+
+    def _remove_locked(self, chunk_id):
+        slot = self._slots.pop(chunk_id, None)
+        if slot is None:
+            return
+        self._ids[slot] = None
+        self._codes[slot] = -1
+        self._deleted += 1
+
+    def remove(self, chunk_ids):
+        """Forget chunks"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove_locked(chunk_id)
+            self._dirty = True
+            if self._deleted > max(1000, self._size // 4):
+                self._compact_locked()
+
+    def _compact_locked(self):
+        """Move live rows together, dropping deleted slots"""
+        alive = np.flatnonzero(self._codes[:self._size] >= 0)
+        # New arrays rather than in-place moves: searches may still be reading the old ones
+        self._matrix = self._allocate(len(self._matrix), self._matrix[alive])
+        scales = np.ones_like(self._scales)
+        scales[:len(alive)] = self._scales[alive]
+        codes = np.full_like(self._codes, -1)
+        codes[:len(alive)] = self._codes[alive]
+        self._scales, self._codes = scales, codes
+        self._ids = [self._ids[slot] for slot in alive]
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._ids)}
+        self._size = len(alive)
+        self._deleted = 0
+
+    # -- search --------------------------------------------------------------
+
+    def _scores(self, matrix, scales, query):
+        """Cosine similarity of every row with the normalized query"""
+        if self.dtype == "float32":
+            return matrix @ query
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + SEARCH_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self.dtype == "int8":
+            scores *= scales
+        return scores
+
+    def search(self, embedding, k: int = 10, filenames=None):
+        """
+        The k nearest chunks as [(chunk id, distance), ...], nearest first.
+        With `filenames`, only chunks of those documents are considered.
+        """
+        query = _normalize(embedding)[0]
+        with self._lock:
+            # Updates only append or swap in new arrays, so these stay valid
+            size, ids = self._size, self._ids
+            matrix, scales, codes = self._matrix[:size], self._scales[:size], self._codes[:size].copy()
+            wanted = None
+            if filenames is not None:
+                wanted = [self._filenames[f] for f in filenames if f in self._filenames]
+
+        if wanted is not None:
+            rows = np.flatnonzero(np.isin(codes, wanted))
+            scores = self._scores(matrix[rows], scales[rows], query)
+        else:
+            rows = None
+            scores = self._scores(matrix, scales, query)
+            scores[codes < 0] = -np.inf
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        results = []
+        for i in best:
+            slot = rows[i] if rows is not None else i
+            if scores[i] == -np.inf or ids[slot] is None:
+                continue
+            results.append((ids[slot], max(0.0, float(2 - 2 * scores[i]))))
+        return results
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self):
+        """Write ids and filenames next to the memory-mapped matrix"""
+        if self.path is None:
+            return
+        with self._lock:
+            self._matrix.flush()
+            np.savez(self.path.with_suffix(".meta.npz"), scales=self._scales[:self._size],
+                     codes=self._codes[:self._size])
+            meta = {"ids": self._ids, "filenames": list(self._filenames), "dim": self.dim,
+                    "dtype": self.dtype, "size": self._size, "deleted": self._deleted}
+            tmp = self.path.with_suffix(".tmp.json")
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, self.path.with_suffix(".json"))
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def save_if_due(self, interval: float = None):
+        """save() if there are unsaved changes and the last save is `interval` seconds old"""
+        interval = DENSE_INDEX_SAVE_SECONDS if interval is None else interval
+        if self._dirty and time.monotonic() - self._saved_at >= interval:
+            self.save()
+
+    @classmethod
+    def load(cls, path):
+        """Reopen a saved index, or None if there is none (or it is incomplete)"""
+        path = Path(path)
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text())
+            arrays = np.load(path.with_suffix(".meta.npz"))
+            matrix = np.load(path, mmap_mode="r+")
+        except (OSError, ValueError):
+            return None
+        if len(meta["ids"]) != meta["size"] or len(matrix) < meta["size"]:
+            return None
+        index = cls(meta["dim"], meta["dtype"])
+        index.path = path
+        index._matrix = matrix
+        index._ids = meta["ids"]
+        index._slots = {chunk_id: slot for slot, chunk_id in enumerate(index._ids) if chunk_id is not None}
+        index._filenames = {name: code for code, name in enumerate(meta["filenames"])}
+        index._size = meta["size"]
+        index._deleted = meta["deleted"]
+        capacity = len(matrix)
+        index._scales = np.ones(capacity, np.float32)
+        index._scales[:index._size] = arrays["scales"]
+        index._codes = np.full(capacity, -1, np.int32)
+        index._codes[:index._size] = arrays["codes"]
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {"chunks": len(self._slots), "dtype": self.dtype, "memory_mapped": self.path is not None,
+                    "matrix_mb": self._matrix.nbytes / 2 ** 20}
+
+
+def _index_path(collection_name):
+    if not DENSE_INDEX_DIR:
+        return None
+    return Path(DENSE_INDEX_DIR) / f"{collection_name}.{DENSE_INDEX_DTYPE}.npy"
+
+
+def _build(collection, batch_size: int = 5000):
+    """Index every chunk already stored in the collection (or reopen a saved index)"""
+    path = _index_path(collection.name)
+    if path is not None:
+        index = DenseIndex.load(path)
+        if index is not None and len(index) == collection.count():
+            return index
+
+    index = None
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        if index is None:
+            index = DenseIndex(embeddings.shape[1], path=path)
+        index.add(page["ids"], embeddings, page["metadatas"])
+        offset += len(page["ids"])
+    if index is not None:
+        index.save()
+    return index
+
+
+def get_dense_index(collection):
+    """The collection's vector index, built on first use (None while the collection is empty)"""
+    with _lock:
+        index = _indexes.get(collection.name)
+        if index is None:
+            index = _build(collection)
+            if index is not None:
+                _indexes[collection.name] = index
+        return index
+
+
+def index_vectors(collection_name: str, chunk_ids, embeddings, metadatas):
+    """Keep an already built index in step with chunks written to the collection"""
+    index = _indexes.get(collection_name)
+    if index is not None:
+        index.add(chunk_ids, embeddings, metadatas)
+        index.save_if_due()
+
+
+def forget_vectors(collection_name: str, chunk_ids):
+    """Keep an already built index in step with chunks deleted from the collection"""
+    index = _indexes.get(collection_name)
+    if index is not None:
+        index.remove(chunk_ids)
+        index.save_if_due()
+
+
+def drop_dense_index(collection_name: str):
+    """Forget the whole index (the collection was reset)"""
+    with _lock:
+        _indexes.pop(collection_name, None)
+        path = _index_path(collection_name)
+        if path is not None:
+            for suffix in (".npy", ".json", ".meta.npz"):
+                path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+@atexit.register
+def save_dense_indexes():
+    """Save the changes not written yet by save_if_due (runs when the process exits)"""
+    with _lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.save_if_due(0)
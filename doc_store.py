@@ -0,0 +1,221 @@
+"""
+Converted documents kept on disk instead of in st.session_state.
+
+Holding every converted markdown string in the session made memory grow with
+the size of each user's uploads. Here the text is written once, gzip
+compressed, under the document's doc_hash (so identical documents are stored
+once for every session), and the session only keeps a small dict:
+
+    doc = store_document("queen.pdf", markdown, doc_hash)
+    # {'filename': 'queen.pdf', 'key': '3fa9...', 'doc_hash': ..., 'chars': 41235, 'words': 6890}
+
+    preview(doc['key'])         # first PREVIEW_CHARS characters, read lazily
+    read_text(doc['key'])       # the whole text, e.g. for ingestion
+    zip_file(docs)              # every document in one zip, built from disk
+
+The key is the same doc_hash the document's chunks carry in their metadata
+(the hash of the uploaded file, or of the text itself), so documents listed
+from the collection can be read back too.
+
+Like the conversion cache, the store is shared by the whole process and the
+least recently used documents are removed once it grows past DOC_STORE_MAX_MB.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+
+
+DOC_STORE_DIR = os.environ.get("DOC_STORE_DIR", ".doc_store")
+# Least recently used documents are removed once the store grows past this size
+DOC_STORE_MAX_MB = float(os.environ.get("DOC_STORE_MAX_MB", "2048"))
+# How much of a document the preview shows
+PREVIEW_CHARS = 500
+
+BLOCK_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+_store_bytes = None         # approximate size of the store, scanned on first use
+_store_entries = 0
+
+
+class DocumentNotStored(LookupError):
+    """Raised when a document's text is no longer in the store (evicted or deleted)"""
+
+
+def _path(key: str) -> Path:
+    return Path(DOC_STORE_DIR) / key[:2] / f"{key}.md.gz"
+
+
+def _touch(path):
+    """Mark the document as recently used so eviction keeps it"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def put_text(text: str, key: str = None) -> str:
+    """Store a text (if it is not stored yet) under `key` (default: its sha256) and return the key"""
+    global _store_bytes, _store_entries
+    data = text.encode("utf-8")
+    key = key or hashlib.sha256(data).hexdigest()
+    path = _path(key)
+    if path.exists():
+        _touch(path)
+        return key
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0) as gz:
+            gz.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    with _lock:
+        if _store_bytes is None:
+            _rescan()
+        else:
+            _store_bytes += path.stat().st_size
+            _store_entries += 1
+        if _store_bytes > DOC_STORE_MAX_MB * 1024 * 1024:
+            _evict()
+    return key
+
+
+def store_document(filename: str, text: str, doc_hash: str = None) -> dict:
+    """Store a converted document; returns the small dict to keep in the session"""
+    return {
+        'filename': filename,
+        'key': put_text(text, doc_hash),
+        'doc_hash': doc_hash,
+        'chars': len(text),
+        'words': len(text.split()),
+    }
+
+
+def open_text(key: str):
+    """The stored text as a file object to read from (decompressed while reading)"""
+    if not key:
+        raise DocumentNotStored("Document has no stored text")
+    path = _path(key)
+    try:
+        f = gzip.open(path, "rt", encoding="utf-8")
+    except FileNotFoundError:
+        raise DocumentNotStored(f"Document {key[:12]} is no longer stored") from None
+    _touch(path)
+    return f
+
+
+def read_text(key: str) -> str:
+    with open_text(key) as f:
+        return f.read()
+
+
+def read_bytes(key: str) -> bytes:
+    """The stored text as utf-8 bytes (for download buttons)"""
+    return read_text(key).encode("utf-8")
+
+
+def preview(key: str, chars: int = PREVIEW_CHARS) -> str:
+    """The beginning of the text, with "..." if there is more; only that part is read"""
+    with open_text(key) as f:
+        text = f.read(chars + 1)
+    return text[:chars] + "..." if len(text) > chars else text
+
+
+def _markdown_name(filename, used):
+    name = f"{Path(filename).stem}.md"
+    if name in used:
+        # queen.pdf and queen.docx: keep the extension in the name
+        name = f"{filename}.md"
+    used.add(name)
+    return name
+
+
+def write_zip(docs, fileobj):
+    """
+    Write the documents into `fileobj` as a zip of <name>.md files, one block
+    at a time. Documents that are no longer stored are left out; returns how
+    many were written.
+    """
+    written, used = 0, set()
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for doc in docs:
+            if not doc['key']:
+                continue
+            path = _path(doc['key'])
+            try:
+                src = gzip.open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with src, zf.open(_markdown_name(doc['filename'], used), "w") as dst:
+                shutil.copyfileobj(src, dst, BLOCK_SIZE)
+            _touch(path)
+            written += 1
+    return written
+
+
+def zip_file(docs):
+    """A temporary file holding the zip of the documents, positioned at its start"""
+    f = tempfile.TemporaryFile()
+    write_zip(docs, f)
+    f.seek(0)
+    return f
+
+
+def _scan():
+    """Return ([(mtime, size, path), ...], total_bytes) for every stored document"""
+    entries = []
+    total = 0
+    for path in Path(DOC_STORE_DIR).glob("*/*.md.gz"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # removed by another process
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    return entries, total
+
+
+def _rescan():
+    global _store_bytes, _store_entries
+    entries, _store_bytes = _scan()
+    _store_entries = len(entries)
+
+
+def _evict():
+    """Remove least recently used documents until the store is below 90% of its cap"""
+    global _store_bytes, _store_entries
+    entries, total = _scan()
+    _store_entries = len(entries)
+    target = DOC_STORE_MAX_MB * 1024 * 1024 * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        _store_entries -= 1
+    _store_bytes = total
+
+
+def doc_store_stats():
+    """Number of stored documents and their compressed size (the directory is only scanned once)"""
+    with _lock:
+        if _store_bytes is None:
+            _rescan()
+        return {"entries": _store_entries, "size_mb": round(_store_bytes / 2 ** 20, 1),
+                "max_mb": DOC_STORE_MAX_MB}
@@ -0,0 +1,62 @@
+"""
+The one embedding model used for both storing chunks and asking questions.
+
+Chunks are embedded with SentenceTransformer at ingest time, so queries must go
+through the same model: passing query_texts= to Chroma would load and run the
+collection's default embedder instead. Query vectors are kept in an LRU, so a
+repeated or popular question is not embedded again.
+"""
+import functools
+import os
+import threading
+
+from telemetry import trace
+
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# How many distinct questions keep their vector in memory
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """The SentenceTransformer model, loaded once per process"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        return _model
+
+
+def embed_documents(texts, batch_size: int = 64):
+    """Embed a list of chunks; returns a numpy array with one row per text"""
+    return get_embedding_model().encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace so trivially different spellings share a cache entry"""
+    return " ".join(text.split())
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_query_cached(normalized: str):
+    return tuple(get_embedding_model().encode(normalized, convert_to_numpy=True).tolist())
+
+
+def embed_query(text: str):
+    """Embedding of a question as a list of floats (cached)"""
+    with trace("embed_query") as span:
+        misses = _embed_query_cached.cache_info().misses
+        vector = _embed_query_cached(normalize_query(text))
+        span.cache_hit = _embed_query_cached.cache_info().misses == misses
+    return list(vector)
+
+
+def query_cache_info():
+    """Hit/miss counters and size of the query embedding cache"""
+    info = _embed_query_cached.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
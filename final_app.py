@@ -1,16 +1,6 @@
-# Fix SQLite version issue for ChromaDB on Streamlit Cloud
-try:
-    __import__('pysqlite3')
-    import sys
-    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-except ImportError:
-    pass
-
 import streamlit as st
-import chromadb
-from transformers import pipeline
+import os
 from pathlib import Path
-import tempfile
 from datetime import datetime
 
 def add_custom_css():
@@ -81,264 +71,260 @@ st.markdown(
 )
 
 
-# Document conversion imports (copy from your converter app)
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions, AcceleratorDevice
-
-# TODO: Copy your convert_to_markdown function here
-def convert_to_markdown(file_path: str) -> str:
-    path = Path(file_path)
-    ext = path.suffix.lower()
-
-    if ext == ".pdf":
-        pdf_opts = PdfPipelineOptions(do_ocr=False)
-        pdf_opts.accelerator_options = AcceleratorOptions(
-            num_threads=4,
-            device=AcceleratorDevice.CPU
-        )
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_options=pdf_opts,
-                    backend=DoclingParseV2DocumentBackend
-                )
-            }
-        )
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext in [".doc", ".docx"]:
-        converter = DocumentConverter()
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
+# Document conversion (shared with the converter app, converters are pooled per process)
+from conversion import convert_batch, converter_pool_info, start_conversion_workers
 
-    if ext == ".txt":
-        try:
-            return path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            return path.read_text(encoding="latin-1", errors="replace")
+# Answer models are loaded once per process and shared by every session
+from models import batching_stats, resident_models, warm_models_in_background
 
-    raise ValueError(f"Unsupported extension: {ext}")
+# docling, transformers and sentence_transformers are imported on first use;
+# PREWARM_IMPORTS=1 imports them in the background right after start-up
+from prewarm import prewarm_in_background
 
 
 # TODO: Copy your setup_documents function here  
 def setup_documents():
     """
-    This function creates our document database
-    NOTE: This runs every time someone uses the app
-    In a real app, you'd want to save this data permanently
+    This function opens our document database
+    The chunks are saved on disk (see vector_store.py), so documents uploaded
+    earlier, or by another session, are still there
     """
-    client = chromadb.Client()
-    try:
-        collection = client.get_collection(name="documents")
-    except Exception:
-        collection = client.create_collection(name="documents")
-    
-    return collection
+    return get_collection("documents")
     
 
 # TODO: Copy your get_answer function here
-def get_answer(collection, question):
-    """
-    This function retrieves the answer to a question from the document database
-    """
-    # Initialize the question-answering pipeline
-    qa_pipeline = pipeline("question-answering", model="distilbert-base-uncased-distilled-squad")
-    
-    # Retrieve relevant documents from the collection
-    results = collection.query(query_texts=[question], n_results=5)
-    
-    # Check if we have any results
-    if not results['documents'] or not results['documents'][0]:
-        return "I don't have enough information to answer that question. Please upload some Queen-related documents first!"
-    
-    # Combine documents into a single context
-    context = " ".join(results['documents'][0])
-    
-    # Check if context is too short
-    if len(context.strip()) < 10:
-        return "I don't have enough information to answer that question. Please upload some Queen-related documents first!"
-    
-    # Get the answer using the QA pipeline
-    answer = qa_pipeline(question=question, context=context)
-    
-    return answer['answer']
+# The answer functions live in qa.py so the background answer workers can use them
+from qa import get_answer_with_source, stream_answer_with_source
+from answer_service import AnswerCancelled, AnswerQueueFull, AnswerTimeout
+from answer_service import queue_info, submit as submit_answer
+from answer_cache import answer_cache_stats
+
+# Per-stage timings of this process (see telemetry.py)
+from telemetry import prometheus_text, snapshot, snapshot_json, trace
+from telemetry import reset as reset_timings
+from embeddings import query_cache_info
+from prompts import token_cache_info
 
 # NEW: Function to handle uploaded files
-import chromadb
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-
-def reset_collection(client, collection_name: str):
-    """Delete existing collection and create a new empty one"""
-    
-    try:
-        # Delete existing collection
-        client.delete_collection(name=collection_name)
-        print(f"Deleted collection '{collection_name}'")
-    except Exception as e:
-        print(f"Collection '{collection_name}' doesn't exist or already deleted")
-    
-    # Create new empty collection
-    new_collection = client.create_collection(name=collection_name)
-    print(f"Created new empty collection '{collection_name}'")
-    
-    return new_collection
-
-
+# Chunks are embedded and stored in batches (see ingest.py)
+from ingest import add_documents, find_document_by_hash
+from uploads import ScratchQuotaExceeded, ScratchSpace
+# Converted text lives on disk; the session only keeps small dicts (see doc_store.py)
+from doc_store import DocumentNotStored, doc_store_stats, open_text, preview, read_bytes, store_document, zip_file
+from vector_store import delete_documents, get_collection
+# Word, chunk and token totals are kept up to date as chunks are stored (see corpus_stats.py)
+from corpus_stats import embedding_counts, get_corpus_stats
 
 
-def add_text_to_chromadb(text: str, filename: str, collection_name: str = "documents"):
+# Helper functions for the features
+def convert_uploaded_files(uploaded_files):
     """
-    Add text to existing or new ChromaDB collection.
-    Safe to call multiple times with same collection_name.
+    Convert uploaded files to markdown (in parallel, see conversion.convert_batch)
+    and put the text in the document store.
+    Files whose exact content is already stored are not converted again.
+    Returns (converted_docs, skipped) where skipped is a list of (filename, stored_as)
     """
+    skipped = []
+    converted_docs = []
     
-    # Split text
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=700,       
-        chunk_overlap=100,     
-        separators=["\n\n", "\n", " ", ""]
-    )
-    chunks = splitter.split_text(text)
-    
-    # Initialize components (reuse if possible)
-    if not hasattr(add_text_to_chromadb, 'client'):
-        add_text_to_chromadb.client = chromadb.Client()
-        add_text_to_chromadb.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        add_text_to_chromadb.collections = {}
-    
-    # Get or create collection
-    if collection_name not in add_text_to_chromadb.collections:
-        try:
-            collection = add_text_to_chromadb.client.get_collection(name=collection_name)
-        except:
-            collection = add_text_to_chromadb.client.create_collection(name=collection_name)
-        add_text_to_chromadb.collections[collection_name] = collection
-    
-    collection = add_text_to_chromadb.collections[collection_name]
-    
-    # Process chunks
-    for i, chunk in enumerate(chunks):
-        embedding = add_text_to_chromadb.embedding_model.encode(chunk).tolist()
-        
-        metadata = {
-            "filename": filename,
-            "chunk_index": i,
-            "chunk_size": len(chunk)
-        }
+    # Uploads are streamed to a scratch folder that is removed when we are done
+    with ScratchSpace() as scratch:
+        names = {}
+        seen = {}
+        for file in uploaded_files:
+            try:
+                path = scratch.save(file)
+            except ScratchQuotaExceeded as e:
+                st.error(str(e))
+                break
+            doc_hash = scratch.digests[path]
+            stored_as = find_document_by_hash(doc_hash) or seen.get(doc_hash)
+            if stored_as:
+                skipped.append((file.name, stored_as))
+                scratch.remove(path)
+                continue
+            names[path] = file.name
+            seen[doc_hash] = file.name
         
-        collection.add(
-            embeddings=[embedding],
-            documents=[chunk],
-            metadatas=[metadata],
-            ids=[f"{filename}_chunk_{i}"]
-        )
-    
-    print(f"Added {len(chunks)} chunks from {filename}")
-    return collection
-
-
-# Helper functions for the features
-def convert_uploaded_files(uploaded_files):
-    """Convert uploaded files to markdown"""
-    converted_docs = []
-    for file in uploaded_files:
-        file_extension = Path(file.name).suffix
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            temp_file.write(file.getvalue())
-            temp_file_path = temp_file.name
+        if not names:
+            return converted_docs, skipped
         
-        text = convert_to_markdown(temp_file_path)
-        converted_docs.append({
-            'filename': file.name,
-            'content': text
-        })
-    return converted_docs
+        progress = st.progress(0)
+        status = st.empty()
+        for idx, result in enumerate(convert_batch(names), start=1):
+            filename = names[result.path]
+            if result.error:
+                st.warning(f"Failed: {filename}: {result.error}")
+            else:
+                converted_docs.append(
+                    store_document(filename, result.markdown, scratch.digests[result.path])
+                )
+            status.text(f"Converted {filename} ({idx}/{len(names)})")
+            progress.progress(idx / len(names))
+        status.empty()
+    return converted_docs, skipped
 
 def add_docs_to_database(collection, converted_docs):
-    """Add documents to database"""
-    count = 0
-    for doc in converted_docs:
-        add_text_to_chromadb(doc['content'], doc['filename'])
-        count += 1
-    return count
-
-# Enhanced answer function with source tracking
-def get_answer_with_source(collection, question):
-    """Enhanced answer function that shows source document"""
-    results = collection.query(
-        query_texts=[question],
-        n_results=3
-    )
-    
-    docs = results["documents"][0]
-    distances = results["distances"][0]
-    ids = results["ids"][0]  # This tells us which document
-    
-    if not docs or min(distances) > 1.5:
-        return "I don't have information about that topic.", "No source"
-    
-    context = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(docs)])
-    
-    prompt = f"""Context information:
-{context}
-
-Question: {question}
-
-Answer:"""
-    
-    ai_model = pipeline("text2text-generation", model="google/flan-t5-small")
-    response = ai_model(prompt, max_length=150)
-    
-    answer = response[0]['generated_text'].strip()
-    
-    # Extract source from best matching document
-    best_source = ids[0].split('_doc_')[0]  # Get filename from ID
-    
-    return answer, best_source
+    """
+    Add documents to database (chunks from all files are embedded together)
+    Only new or changed chunks are embedded; returns the ingestion stats
+    Each document is streamed from the store line by line while it is chunked
+    """
+    docs = ({**doc, 'content': open_text(doc['key'])} for doc in converted_docs)
+    return add_documents(docs, collection.name)
 
 # Document manager with delete option
 def show_document_manager():
     """Display document manager interface"""
     st.subheader("🎶 Manage your Queen archive here")
     
-    if not st.session_state.converted_docs:
+    # Every document in the shared store, also those uploaded in earlier sessions
+    docs = get_corpus_stats(st.session_state.collection).documents()
+    if not docs:
         st.info("No documents uploaded yet.")
         return
     
     # Show each document with delete button
-    for i, doc in enumerate(st.session_state.converted_docs):
+    selected = []
+    for i, doc in enumerate(docs):
+        name = doc['filename']
         col1, col2, col3 = st.columns([3, 1, 1])
         
         with col1:
-            st.write(f"📄 {doc['filename']}")
-            st.write(f"   Words: {len(doc['content'].split())}")
+            if st.checkbox(f"📄 {name}", key=f"select_{name}"):
+                selected.append(name)
+            st.write(f"   Words: {doc['words']:,} · Chunks: {doc['chunks']}")
         
         with col2:
             # Preview button
-            if st.button("Preview", key=f"preview_{i}"):
-                st.session_state[f'show_preview_{i}'] = True
+            if st.button("Preview", key=f"preview_{name}"):
+                st.session_state[f'show_preview_{name}'] = True
         
         with col3:
             # Delete button
-            if st.button("Delete", key=f"delete_{i}"):
-                # Remove from session state
-                st.session_state.converted_docs.pop(i)
-                # Rebuild database
-                st.session_state.collection = setup_documents()
-                add_docs_to_database(st.session_state.collection, st.session_state.converted_docs)
+            if st.button("Delete", key=f"delete_{name}"):
+                remove_documents([name])
                 st.rerun()
         
         # Show preview if requested
-        if st.session_state.get(f'show_preview_{i}', False):
-            with st.expander(f"Preview: {doc['filename']}", expanded=True):
-                st.text(doc['content'][:500] + "..." if len(doc['content']) > 500 else doc['content'])
-                if st.button("Hide Preview", key=f"hide_{i}"):
-                    st.session_state[f'show_preview_{i}'] = False
+        if st.session_state.get(f'show_preview_{name}', False):
+            with st.expander(f"Preview: {name}", expanded=True):
+                try:
+                    # The text is kept in the document store under the document's hash
+                    st.text(preview(doc['doc_hash']))
+                    # The file is only read when the button is clicked
+                    st.download_button(
+                        "Download markdown",
+                        data=lambda key=doc['doc_hash']: read_bytes(key),
+                        file_name=f"{Path(name).stem}.md",
+                        mime="text/markdown",
+                        key=f"download_{name}"
+                    )
+                except DocumentNotStored:
+                    st.warning("The text of this document is no longer stored; its chunks are still searchable.")
+                if st.button("Hide Preview", key=f"hide_{name}"):
+                    st.session_state[f'show_preview_{name}'] = False
                     st.rerun()
+    
+    st.download_button(
+        "Download all as zip",
+        data=lambda docs=[{'filename': d['filename'], 'key': d['doc_hash']} for d in docs]: zip_file(docs),
+        file_name="queen_archive.zip",
+        mime="application/zip",
+        key="download_all"
+    )
+    
+    # Delete several documents in one go
+    if selected and st.button(f"Delete {len(selected)} selected", key="delete_selected"):
+        remove_documents(selected)
+        st.rerun()
+
+def remove_documents(filenames):
+    """Delete documents from the database and the session (only their chunks are touched)"""
+    delete_documents(filenames, st.session_state.collection.name)
+    st.session_state.converted_docs = [
+        doc for doc in st.session_state.converted_docs if doc['filename'] not in filenames
+    ]
+    for filename in filenames:
+        st.session_state.pop(f"select_{filename}", None)
+        st.session_state.pop(f"show_preview_{filename}", None)
+
+# Asking questions in the background
+# With ANSWER_STREAMING=1 (default) the answer is shown token by token as it is generated
+ANSWER_STREAMING = os.environ.get("ANSWER_STREAMING", "1") == "1"
+
+def ask_question(question):
+    """Queue a question on the answer workers (replacing any unanswered one)"""
+    pending = st.session_state.get('pending_answer')
+    if pending is not None:
+        pending['request'].cancel()
+        st.session_state.pending_answer = None
+    
+    # Filled in by the worker: prompt tokens used, chunks packed, cache hit
+    info = {}
+    try:
+        if ANSWER_STREAMING:
+            request = submit_answer(stream_answer_with_source, st.session_state.collection, question,
+                                    stream=True, info=info)
+        else:
+            request = submit_answer(get_answer_with_source, st.session_state.collection, question, info=info)
+    except AnswerQueueFull as e:
+        st.warning(str(e))
+        return
+    
+    st.session_state.last_answer = None
+    st.session_state.pending_answer = {
+        'question': question, 'request': request, 'streaming': ANSWER_STREAMING, 'info': info
+    }
+
+def finish_pending_answer(pending):
+    """Store the answer (or error) of a finished request and add it to the history"""
+    st.session_state.pending_answer = None
+    request = pending['request']
+    try:
+        answer, source = request.result()
+        st.session_state.last_answer = {
+            'question': pending['question'], 'answer': answer, 'source': source,
+            'first_token': request.time_to_first_token(),
+            'info': pending.get('info') or {},
+        }
+        # Add to history
+        add_to_search_history(pending['question'], answer, source)
+    except AnswerCancelled:
+        pass
+    except AnswerTimeout:
+        st.session_state.last_answer = {'error': f"Sorry, that took too long (over {request.elapsed():.0f}s). Please try again."}
+    except Exception as e:
+        st.session_state.last_answer = {'error': f"Could not answer that question: {e}"}
+
+def stream_pending_answer():
+    """Write a streaming answer to the page as it is generated"""
+    pending = st.session_state.get('pending_answer')
+    if pending is None or not pending.get('streaming'):
+        return
+    
+    st.write("**Answer:**")
+    st.write_stream(pending['request'].stream())
+    finish_pending_answer(pending)
+    
+    # Rerun so the finished answer and history are shown the usual way
+    st.rerun()
+
+def show_pending_answer():
+    """Show progress of the pending question, and its answer once it is ready"""
+    pending = st.session_state.get('pending_answer')
+    if pending is None:
+        return
+    
+    request = pending['request']
+    if not request.done():
+        st.info(f"🎤 Warming up Freddie’s mic... ({request.status()}, {request.elapsed():.0f}s)")
+        return
+    
+    finish_pending_answer(pending)
+    
+    # Rerun the whole page so the answer and history show up and polling stops
+    st.rerun()
 
 # Search history
 def add_to_search_history(question, answer, source):
@@ -374,16 +360,18 @@ def show_search_history():
 
 # Document statistics
 def show_document_stats():
-    """Show statistics about uploaded documents"""
+    """Show statistics about the documents in the archive (read from running totals)"""
     st.subheader("🎚️ Statistics about uploaded docs")
     
-    if not st.session_state.converted_docs:
+    collection = st.session_state.collection
+    stats = get_corpus_stats(collection).summary()
+    if not stats['documents']:
         st.info("No documents to analyze.")
         return
     
     # Calculate stats
-    total_docs = len(st.session_state.converted_docs)
-    total_words = sum(len(doc['content'].split()) for doc in st.session_state.converted_docs)
+    total_docs = stats['documents']
+    total_words = stats['words']
     avg_words = total_words // total_docs if total_docs > 0 else 0
     
     # Display in columns
@@ -398,21 +386,128 @@ def show_document_stats():
     with col3:
         st.metric("Average Words/Doc", f"{avg_words:,}")
     
-    # Show breakdown by file type
-    file_types = {}
-    for doc in st.session_state.converted_docs:
-        ext = Path(doc['filename']).suffix.lower()
-        file_types[ext] = file_types.get(ext, 0) + 1
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Chunks", f"{stats['chunks']:,}")
     
+    with col2:
+        st.metric("Tokens", f"{stats['tokens']:,}")
+    
+    with col3:
+        # every chunk is stored with its embedding
+        st.metric("Embeddings", f"{stats['chunks']:,}")
+    
+    embedded = embedding_counts(collection.name)
+    st.caption(
+        f"Since start-up: {embedded['embedded']:,} chunks embedded, "
+        f"{embedded['reused']:,} reused an existing vector"
+    )
+    if stats['uncounted']:
+        st.caption(f"{stats['uncounted']:,} older chunks have no token count yet; upload them again to count them.")
+    
+    # Show breakdown by file type
     st.write("**File Types:**")
-    for ext, count in file_types.items():
-        st.write(f"• {ext}: {count} files")
+    for ext, totals in stats['by_extension'].items():
+        st.write(
+            f"• {ext or 'no extension'}: {totals['documents']} files · "
+            f"{totals['words']:,} words · {totals['chunks']:,} chunks · {totals['tokens']:,} tokens"
+        )
+    
+    store = doc_store_stats()
+    st.caption(f"Document store: {store['entries']} documents, {store['size_mb']} MB compressed on disk")
+
+def show_model_stats():
+    """Show which answer models are loaded and how much memory they use"""
+    st.subheader("🧠 Loaded models")
+    
+    models = resident_models()
+    if not models:
+        st.info("No models loaded yet. They load on the first question.")
+        return
+    
+    st.table(models)
+    total_mb = sum(m['memory_mb'] for m in models)
+    st.write(f"**Total model memory:** {total_mb:,.1f} MB")
+    
+    batching = batching_stats()
+    if batching:
+        st.write("**Generation batches:**")
+        st.table(batching)
+    
+    cache = answer_cache_stats()
+    st.write(
+        f"**Answer cache:** {cache['size']} answers · {cache['hits']} hits · "
+        f"{cache['semantic_hits']} similar-question hits · {cache['misses']} misses"
+    )
+
+def show_performance():
+    """Show how long each pipeline stage takes in this process"""
+    st.subheader("⏱️ Pipeline timings")
+    
+    rows = snapshot()
+    if not rows:
+        st.info("Nothing measured yet. Upload a document or ask a question.")
+        return
+    
+    st.dataframe(
+        [
+            {
+                "stage": r['stage'],
+                "calls": r['calls'],
+                "p50 ms": round(r['p50_ms'], 1),
+                "p95 ms": round(r['p95_ms'], 1),
+                "p99 ms": round(r['p99_ms'], 1),
+                "max ms": round(r['max_ms'], 1),
+                "total s": round(r['total_s'], 2),
+                "size": r['size'],
+                "cache hits": r['cache_hits'],
+                "cache misses": r['cache_misses'],
+                "errors": r['errors'],
+            }
+            for r in rows
+        ],
+        hide_index=True,
+    )
+    st.caption("Percentiles are over the last calls of each stage, totals since the app started.")
+    
+    stage = st.selectbox("Latency histogram of", [r['stage'] for r in rows])
+    buckets = next(r['buckets'] for r in rows if r['stage'] == stage)
+    st.bar_chart(
+        [{"up to": f"{bound} s", "calls": n} for bound, n in buckets.items()],
+        x="up to", y="calls", sort=False,
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("Download JSON", snapshot_json(), file_name="timings.json", mime="application/json")
+    with col2:
+        st.download_button("Download Prometheus", prometheus_text(), file_name="timings.prom", mime="text/plain")
+    with col3:
+        if st.button("Reset timings"):
+            reset_timings()
+            st.rerun()
+    
+    st.write("**Caches and queues:**")
+    queries = query_cache_info()
+    tokens = token_cache_info()
+    queue = queue_info()
+    st.write(
+        f"• Question embeddings: {queries['size']}/{queries['max_size']} cached · "
+        f"{queries['hits']} hits · {queries['misses']} misses"
+    )
+    st.write(f"• Chunk token counts: {tokens['size']:,}/{tokens['max_size']:,} cached")
+    st.write(f"• Answer queue: {queue['pending']} waiting or running on {queue['workers']} workers")
+    for key, created in converter_pool_info().items():
+        st.write(f"• Converters built for {' / '.join(map(str, key))}: {created}")
 
 # Enhanced UI with tabs
 def create_tabbed_interface():
     """Create a tabbed interface for better organization"""
     
-    tab1, tab2, tab3, tab4 = st.tabs(["🎼 Upload", "🎙️ Ask questions", "🎶 Manage archive", "🎚️ Stats"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(
+        ["🎼 Upload", "🎙️ Ask questions", "🎶 Manage archive", "🎚️ Stats", "⏱️ Performance"]
+    )
     
     with tab1:
         st.header("🎼Upload & convert Queen documents")
@@ -425,31 +520,70 @@ def create_tabbed_interface():
         
         if st.button("Chunk and store Queen docs🎸"):
             if uploaded_files:
-                converted_docs = convert_uploaded_files(uploaded_files)
+                converted_docs, skipped = convert_uploaded_files(uploaded_files)
+                for filename, stored_as in skipped:
+                    if filename == stored_as:
+                        st.info(f"{filename} is unchanged, skipped.")
+                    else:
+                        st.info(f"{filename} has the same content as {stored_as}, skipped.")
                 if converted_docs:
-                    num_added = add_docs_to_database(st.session_state.collection, converted_docs)
-                    st.session_state.converted_docs.extend(converted_docs)
-                    st.success(f"Added {num_added} documents!")
+                    stats = add_docs_to_database(st.session_state.collection, converted_docs)
+                    # A re-uploaded file replaces its older version in the list
+                    new_names = {doc['filename'] for doc in converted_docs}
+                    st.session_state.converted_docs = [
+                        doc for doc in st.session_state.converted_docs if doc['filename'] not in new_names
+                    ] + converted_docs
+                    st.success(f"Added {len(converted_docs)} documents!")
+                    st.write(
+                        f"Chunks embedded: {stats['chunks_embedded']} · "
+                        f"reused: {stats['chunks_reused']} · "
+                        f"unchanged: {stats['chunks_unchanged']} · "
+                        f"removed: {stats['chunks_removed']}"
+                    )
     
     with tab2:
         st.header("Curious about Queen? Type your question here!🎧")
         
-        if st.session_state.converted_docs:
+        # The store is shared, so there may be documents from earlier sessions
+        if st.session_state.converted_docs or st.session_state.collection.count():
             question = st.text_input("Your question:")
             
             if st.button("Rock me the answer!🎸"):
                 if question:
-                    with st.spinner("🎤 Warming up Freddie’s mic..."):
-                
-                        answer, source = get_answer_with_source(st.session_state.collection, question)
-                    
-                    st.write("**Answer:**")
-                    st.write(answer)
-                    st.write(f"**Source:** {source}")
-                    st.success("👑 The Queen archives have spoken – enjoy your insight!")
-                    
-                    # Add to history
-                    add_to_search_history(question, answer, source)
+                    ask_question(question)
+            
+            # A streaming answer is written here token by token
+            stream_pending_answer()
+            
+            # Otherwise poll the answer in the background; only this part of the page reruns
+            polling = st.session_state.get('pending_answer') is not None
+            st.fragment(show_pending_answer, run_every=0.5 if polling else None)()
+            
+            last = st.session_state.get('last_answer')
+            if last and 'error' in last:
+                st.error(last['error'])
+            elif last:
+                st.write("**Answer:**")
+                st.write(last['answer'])
+                st.write(f"**Source:** {last['source']}")
+                if last.get('first_token') is not None:
+                    st.caption(f"First words after {last['first_token'] * 1000:.0f} ms")
+                info = last.get('info') or {}
+                if info.get('cached'):
+                    st.caption("Answered from the cache")
+                elif 'prompt_tokens' in info:
+                    st.caption(
+                        f"Prompt: {info['prompt_tokens']} of {info['token_budget']} tokens · "
+                        f"{info['chunks_used']} chunks used, {info['chunks_dropped']} left out"
+                    )
+                if info.get('timings'):
+                    stages = " · ".join(
+                        f"{name[:-3]} {ms:,.0f} ms" for name, ms in info['timings'].items()
+                    )
+                    if 'rerank' in info:
+                        stages += f" (rerank: {info['rerank']})"
+                    st.caption(f"Timings: {stages}")
+                st.success("👑 The Queen archives have spoken – enjoy your insight!")
         else:
             st.info("Upload documents first!")
         
@@ -461,6 +595,10 @@ def create_tabbed_interface():
     
     with tab4:
         show_document_stats()
+        show_model_stats()
+    
+    with tab5:
+        show_performance()
 
 # MAIN APP
 def main():
@@ -471,6 +609,13 @@ def main():
         st.session_state.search_history = []
     if 'collection' not in st.session_state:
         st.session_state.collection = setup_documents()
+    # Optionally load the answer models in the background (WARM_MODELS_ON_STARTUP=1)
+    if os.environ.get("WARM_MODELS_ON_STARTUP") == "1":
+        warm_models_in_background()
+    if os.environ.get("PREWARM_IMPORTS") == "1":
+        prewarm_in_background()
+    # Conversion workers start (and load their models) before the first upload
+    start_conversion_workers()
     
     add_custom_css()
     st.markdown('<h1 class="main-header" style="color:white;">👑Queen: The Rock Royalty🎸</h1>', unsafe_allow_html=True)
@@ -512,7 +657,8 @@ def main():
         """, unsafe_allow_html=True)
     
     # Create the tabbed interface with all features
-    create_tabbed_interface()
+    with trace("render"):
+        create_tabbed_interface()
 
 if __name__ == "__main__":
     main()
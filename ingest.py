@@ -0,0 +1,311 @@
+"""
+Chunking, embedding and storing documents in the vector store.
+
+Chunks are not embedded and written one by one: they are collected (across
+several files if needed), encoded in batches by the shared embedding model
+(embeddings.py) and then written to Chroma with a few large calls. Documents and chunks are keyed by a
+hash of their content, so unchanged work is skipped on re-upload.
+
+Documents are chunked along their headings, lists and tables (chunker.py), and
+every chunk records its heading path in the `heading` metadata, and its word and
+token counts in `words` and `tokens` (summed up by corpus_stats.py). Tokens are
+counted with the generation model's tokenizer, a batch at a time; if it cannot
+be loaded the chunks are stored without `tokens`.
+"""
+import hashlib
+import os
+
+from embeddings import embed_documents
+from chunker import Chunk, chunk_markdown
+from corpus_stats import count_chunks, count_embeddings, uncount_chunks
+from dense_index import forget_vectors, index_vectors
+from keyword_index import forget_chunks, index_chunks
+from models import GENERATION_MODEL
+from prompts import count_tokens_batch
+from telemetry import timed_iter, trace
+from vector_store import bump_corpus_version, get_client, get_collection
+
+
+# How many chunks go through the embedding model in one forward pass
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# How many chunks are written to Chroma per add/update/delete call
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", "2000"))
+# "structure" follows headings, lists and tables (chunker.py); "recursive" is
+# the plain 700/100 character splitter
+CHUNKER = os.environ.get("CHUNKER", "structure")
+
+_tokens_unavailable = False     # set once the tokenizer failed to load
+
+
+def split_text(text: str):
+    """Split a document into overlapping chunks of about 700 characters (CHUNKER=recursive)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=700,
+        chunk_overlap=100,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return splitter.split_text(text)
+
+
+def chunk_text(text):
+    """
+    Chunks of a markdown document (a string, or an iterable of lines such as an
+    open file), with the chunker chosen by CHUNKER
+    """
+    if CHUNKER == "recursive":
+        if not isinstance(text, str):
+            text = "".join(text)
+        return (Chunk(piece, "") for piece in split_text(text))
+    return chunk_markdown(text)
+
+
+def content_hash(data) -> str:
+    """sha256 hex digest of bytes or text, used to recognise documents and chunks"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_id(filename: str, chunk_hash: str) -> str:
+    return f"{filename}_chunk_{chunk_hash[:16]}"
+
+
+def find_document_by_hash(doc_hash: str, collection_name: str = "documents"):
+    """Return the filename already stored with this content hash, or None"""
+    found = get_collection(collection_name).get(where={"doc_hash": doc_hash}, limit=1, include=["metadatas"])
+    if found["ids"]:
+        return found["metadatas"][0]["filename"]
+    return None
+
+
+class BulkIngestor:
+    """
+    Collects chunks from one or more documents and stores them in bulk.
+
+        ingestor = BulkIngestor("documents")
+        for doc in docs:
+            ingestor.add_document(doc['content'], doc['filename'], doc.get('doc_hash'))
+        ingestor.flush()
+
+    Ingestion is incremental: chunks are identified by a hash of their text, so
+    re-adding a document only embeds chunks that are new, reuses the vectors of
+    identical chunks already in the store, and removes chunks that are gone.
+    What was done is counted in `stats`.
+
+    Chunks are flushed automatically once `INSERT_BATCH_SIZE` are pending.
+    """
+
+    def __init__(self, collection_name: str = "documents",
+                 embed_batch_size: int = None, insert_batch_size: int = None):
+        self.collection = get_collection(collection_name)
+        self.embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+        insert_batch_size = insert_batch_size or INSERT_BATCH_SIZE
+        # Chroma rejects adds above its own limit
+        max_batch = getattr(get_client(), "get_max_batch_size", lambda: insert_batch_size)()
+        self.insert_batch_size = max(1, min(insert_batch_size, max_batch))
+        self.ids, self.chunks, self.metadatas = [], [], []
+        self.update_ids, self.update_metadatas, self.update_chunks = [], [], []
+        self.delete_ids = []
+        self.total_chunks = 0
+        self.stats = {
+            "documents": 0,
+            "chunks_embedded": 0,     # new text, ran through the embedding model
+            "chunks_reused": 0,       # same text already stored elsewhere, vector copied
+            "chunks_unchanged": 0,    # already stored for this document, nothing to do
+            "chunks_removed": 0,      # no longer in the document, deleted
+        }
+
+    def add_document(self, text: str, filename: str, doc_hash: str = None):
+        """Queue the changes needed to store one document; returns the number of chunks"""
+        chunks = timed_iter("split", chunk_text(text))
+        return self.add_chunks(chunks, filename, doc_hash or content_hash(text))
+
+    def add_chunks(self, chunks, filename: str, doc_hash: str):
+        """
+        Like add_document, for a document that is already being chunked (any
+        iterable of chunker.Chunk). Chunks are consumed one at a time, and full
+        batches are embedded and stored while the rest is still coming in.
+        """
+        existing = self.collection.get(where={"filename": filename}, include=["metadatas"])
+        stored = {}
+        for id_, metadata in zip(existing["ids"], existing["metadatas"]):
+            h = (metadata or {}).get("chunk_hash")
+            if h and h not in stored:
+                stored[h] = id_
+            else:
+                self.delete_ids.append(id_)
+                self.stats["chunks_removed"] += 1
+
+        # Identical chunks inside one document are stored once
+        seen = set()
+        for chunk in chunks:
+            h = content_hash(chunk.text)
+            if h in seen:
+                continue
+            seen.add(h)
+            metadata = {
+                "filename": filename,
+                "chunk_index": len(seen) - 1,
+                "chunk_size": len(chunk.text),
+                "chunk_hash": h,
+                "doc_hash": doc_hash,
+                "heading": chunk.heading,
+                "words": len(chunk.text.split()),
+            }
+            if h in stored:
+                # Already embedded; just keep its position and document hash current
+                self.update_ids.append(stored[h])
+                self.update_metadatas.append(metadata)
+                self.update_chunks.append(chunk.text)
+                self.stats["chunks_unchanged"] += 1
+            else:
+                self.ids.append(chunk_id(filename, h))
+                self.chunks.append(chunk.text)
+                self.metadatas.append(metadata)
+                if len(self.chunks) >= self.insert_batch_size:
+                    self.flush()
+
+        # Stored chunks that are no longer in the document
+        for h, id_ in stored.items():
+            if h not in seen:
+                self.delete_ids.append(id_)
+                self.stats["chunks_removed"] += 1
+
+        self.stats["documents"] += 1
+        return len(seen)
+
+    def _known_embeddings(self, hashes):
+        """Vectors of chunks with these hashes that are already stored, {hash: vector}"""
+        known = {}
+        for start in range(0, len(hashes), self.insert_batch_size):
+            found = self.collection.get(
+                where={"chunk_hash": {"$in": hashes[start:start + self.insert_batch_size]}},
+                include=["metadatas", "embeddings"]
+            )
+            for metadata, embedding in zip(found["metadatas"], found["embeddings"]):
+                known.setdefault(metadata["chunk_hash"], list(embedding))
+        return known
+
+    def _add_token_counts(self, texts, metadatas):
+        """
+        Set `tokens` in the metadatas, counted with the tokenizer prompts are
+        packed with (which also warms its cache). Left unset if it is unavailable.
+        """
+        global _tokens_unavailable
+        if not texts or _tokens_unavailable:
+            return
+        try:
+            with trace("count_tokens", size=len(texts)):
+                counts = count_tokens_batch(texts, GENERATION_MODEL, [m["chunk_hash"] for m in metadatas])
+        except Exception as e:
+            # prompts.get_tokenizer remembers the failure too, so it is reported once per process
+            print(f"Could not count tokens, storing chunks without them: {e}")
+            _tokens_unavailable = True
+            return
+        for metadata, count in zip(metadatas, counts):
+            metadata["tokens"] = count
+
+    def flush(self):
+        """Embed and store everything queued so far"""
+        flushed = len(self.chunks)
+        self._add_token_counts(self.chunks + self.update_chunks, self.metadatas + self.update_metadatas)
+
+        if self.chunks:
+            hashes = [m["chunk_hash"] for m in self.metadatas]
+            embeddings = [None] * len(self.chunks)
+            known = self._known_embeddings(hashes)
+            missing = []
+            for i, h in enumerate(hashes):
+                if h in known:
+                    embeddings[i] = known[h]
+                else:
+                    missing.append(i)
+
+            # The same new text may appear in several queued documents; embed it once
+            to_embed = {}
+            for i in missing:
+                to_embed.setdefault(hashes[i], self.chunks[i])
+            if to_embed:
+                with trace("embed", size=len(to_embed)):
+                    vectors = embed_documents(to_embed.values(), batch_size=self.embed_batch_size)
+                new_vectors = {h: vector.tolist() for h, vector in zip(to_embed, vectors)}
+                for i in missing:
+                    embeddings[i] = new_vectors[hashes[i]]
+            self.stats["chunks_embedded"] += len(to_embed)
+            self.stats["chunks_reused"] += len(self.chunks) - len(to_embed)
+            count_embeddings(self.collection.name, len(to_embed), len(self.chunks) - len(to_embed))
+
+            with trace("store", size=len(self.chunks)):
+                for start in range(0, len(self.chunks), self.insert_batch_size):
+                    end = start + self.insert_batch_size
+                    self.collection.upsert(
+                        ids=self.ids[start:end],
+                        embeddings=embeddings[start:end],
+                        documents=self.chunks[start:end],
+                        metadatas=self.metadatas[start:end]
+                    )
+            index_chunks(self.collection.name, self.ids, self.chunks)
+            index_vectors(self.collection.name, self.ids, embeddings, self.metadatas)
+            count_chunks(self.collection.name, self.ids, self.metadatas)
+
+        for start in range(0, len(self.update_ids), self.insert_batch_size):
+            end = start + self.insert_batch_size
+            self.collection.update(ids=self.update_ids[start:end], metadatas=self.update_metadatas[start:end])
+        count_chunks(self.collection.name, self.update_ids, self.update_metadatas)
+
+        # Stale chunks go last, so a failed flush never leaves a document with fewer chunks
+        for start in range(0, len(self.delete_ids), self.insert_batch_size):
+            self.collection.delete(ids=self.delete_ids[start:start + self.insert_batch_size])
+        forget_chunks(self.collection.name, self.delete_ids)
+        forget_vectors(self.collection.name, self.delete_ids)
+        uncount_chunks(self.collection.name, self.delete_ids)
+
+        if flushed or self.update_ids or self.delete_ids:
+            bump_corpus_version(self.collection.name)
+        self.total_chunks += flushed
+        self.ids, self.chunks, self.metadatas = [], [], []
+        self.update_ids, self.update_metadatas, self.update_chunks = [], [], []
+        self.delete_ids = []
+        return flushed
+
+
+def add_text_to_chromadb(text: str, filename: str, collection_name: str = "documents"):
+    """
+    Add text to existing or new ChromaDB collection.
+    Safe to call multiple times with same collection_name.
+    """
+    with trace("ingest", size=1):
+        ingestor = BulkIngestor(collection_name)
+        ingestor.add_document(text, filename)
+        ingestor.flush()
+
+    print(f"Added {ingestor.total_chunks} chunks from {filename}")
+    return ingestor.collection
+
+
+def add_documents(docs, collection_name: str = "documents"):
+    """
+    Add many {'filename', 'content'[, 'doc_hash']} documents in one go, batching
+    chunks across files. `docs` may be a generator, so only one document's
+    content has to be in memory at a time. `content` may also be an open text
+    file (then `doc_hash` is required): it is chunked line by line as it is
+    read, and closed afterwards. Returns the ingestor's stats dict.
+    """
+    with trace("ingest") as span:
+        ingestor = BulkIngestor(collection_name)
+        span.size = 0
+        for doc in docs:
+            content = doc['content']
+            if isinstance(content, str):
+                ingestor.add_document(content, doc['filename'], doc.get('doc_hash'))
+            else:
+                with content:
+                    chunks = timed_iter("split", chunk_text(content))
+                    ingestor.add_chunks(chunks, doc['filename'], doc['doc_hash'])
+            span.size += 1
+        ingestor.flush()
+
+    print(f"Stored {span.size} documents: {ingestor.stats}")
+    return ingestor.stats
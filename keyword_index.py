@@ -0,0 +1,204 @@
+"""
+In-memory BM25 keyword index over the chunks of a collection.
+
+Vector search alone often misses exact album titles and years, so questions
+are also matched word for word. There is one index per collection and process.
+It is built from Chroma the first time it is used, and after that it is kept
+up to date by ingest.py and vector_store.py as chunks are written or deleted:
+
+    index = get_keyword_index(collection)
+    index.search("Innuendo 1991", k=8)   # [(chunk id, score), ...]
+
+Postings are compact arrays (chunk slot, term frequency) that numpy scores
+without copying. Deleted chunks leave holes that are compacted away once they
+make up a quarter of the index.
+"""
+import math
+import os
+import re
+import threading
+from array import array
+
+import numpy as np
+
+
+# BM25 parameters
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been before but by can did do does
+during for from had has have he her his how i if in into is it its me my no not of
+on or our she so than that the their them then there these they this those to was
+we were what when where which who whom why will with would you your
+""".split())
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def tokenize(text: str):
+    """Lower-cased words without stopwords"""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class KeywordIndex:
+    """BM25 over chunk texts; every method is safe to call from several threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = []                  # slot -> chunk id (None once deleted)
+        self._slots = {}                # chunk id -> slot
+        self._lengths = array("I")      # slot -> number of terms (0 once deleted)
+        self._postings = {}             # term -> (array of slots, array of term frequencies)
+        self._total_length = 0
+        self._deleted = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _add_locked(self, chunk_id, text):
+        if chunk_id in self._slots:
+            self._remove_locked(chunk_id)
+        terms = tokenize(text)
+        slot = len(self._ids)
+        self._ids.append(chunk_id)
+        self._slots[chunk_id] = slot
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].append(slot)
+            postings[1].append(tf)
+
+    def _remove_locked(self, chunk_id):
+        slot = self._slots.pop(chunk_id, None)
+        if slot is None:
+            return
+        self._ids[slot] = None
+        self._total_length -= self._lengths[slot]
+        self._lengths[slot] = 0
+        self._deleted += 1
+
+    def add(self, chunk_ids, texts):
+        """Index (or re-index) chunks"""
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                self._add_locked(chunk_id, text)
+
+    def remove(self, chunk_ids):
+        """Forget chunks"""
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove_locked(chunk_id)
+            if self._deleted > max(1000, len(self._ids) // 4):
+                self._compact_locked()
+
+    def _compact_locked(self):
+        """Drop deleted slots and renumber the rest"""
+        alive = np.array([i is not None for i in self._ids], dtype=bool)
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            slots_np = np.frombuffer(slots, dtype=np.uint32)
+            keep = alive[slots_np]
+            if keep.any():
+                postings[term] = (
+                    array("I", new_slot[slots_np[keep]].astype(np.uint32).tobytes()),
+                    array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+                )
+        self._postings = postings
+        self._ids = [i for i in self._ids if i is not None]
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._ids)}
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._deleted = 0
+
+    def search(self, query: str, k: int = 10, min_coverage: float = 0.0):
+        """
+        The k best chunks for the query as [(chunk id, BM25 score), ...],
+        leaving out chunks that contain less than `min_coverage` of its words
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._slots)
+            if not terms or not n_docs:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            avg_length = max(self._total_length / n_docs, 1e-9)
+            # Score only the postings of the query's terms, not every chunk
+            all_slots, all_scores = [], []
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                slots = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+                # document frequency counts deleted slots too until compaction; close enough
+                idf = math.log(1 + (n_docs - len(slots) + 0.5) / (len(slots) + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[slots] / avg_length)
+                all_slots.append(slots)
+                all_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+            if not all_slots:
+                return []
+            slots, inverse, matched = np.unique(np.concatenate(all_slots), return_inverse=True, return_counts=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            keep = (lengths[slots] > 0) & (matched >= min_coverage * len(terms))
+            slots, scores = slots[keep], scores[keep]
+            k = min(k, len(slots))
+            if k <= 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(self._ids[slots[i]], float(scores[i])) for i in best]
+
+    def stats(self):
+        with self._lock:
+            return {"chunks": len(self._slots), "terms": len(self._postings), "deleted_slots": self._deleted}
+
+
+def _build(collection, batch_size: int = 5000):
+    """Index every chunk already stored in the collection"""
+    index = KeywordIndex()
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        index.add(page["ids"], page["documents"])
+        offset += len(page["ids"])
+    return index
+
+
+def get_keyword_index(collection):
+    """The collection's keyword index, built from its stored chunks on first use"""
+    with _lock:
+        index = _indexes.get(collection.name)
+        if index is None:
+            index = _indexes[collection.name] = _build(collection)
+        return index
+
+
+def index_chunks(collection_name: str, chunk_ids, texts):
+    """Keep an already built index in step with chunks written to the collection"""
+    index = _indexes.get(collection_name)
+    if index is not None:
+        index.add(chunk_ids, texts)
+
+
+def forget_chunks(collection_name: str, chunk_ids):
+    """Keep an already built index in step with chunks deleted from the collection"""
+    index = _indexes.get(collection_name)
+    if index is not None:
+        index.remove(chunk_ids)
+
+
+def drop_index(collection_name: str):
+    """Forget the whole index (the collection was reset)"""
+    with _lock:
+        _indexes.pop(collection_name, None)
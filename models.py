@@ -0,0 +1,329 @@
+"""
+Process-wide registry for the Hugging Face pipelines used to answer questions.
+
+Calling transformers.pipeline() loads the tokenizer and weights from disk, so
+doing it inside get_answer made every question pay the full model load. Here
+each pipeline is loaded once (on first use, or up front with warm_models) and
+kept in a small LRU, so models nobody uses any more are dropped from memory.
+
+Generation requests from concurrent users are grouped into padded batches by
+GenerationBatcher, so the model runs a few larger batches instead of many
+single prompts.
+
+transformers (and torch with it) is imported on the first load, not when this
+module is imported.
+"""
+import gc
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from telemetry import record, timed_iter, trace
+
+
+# (task, model) pairs used by the apps
+GENERATION_MODEL = ("text2text-generation", "google/flan-t5-small")
+QA_MODEL = ("question-answering", "distilbert-base-uncased-distilled-squad")
+
+# How many pipelines may stay loaded at once before the least recently used is evicted
+MAX_RESIDENT_MODELS = int(os.environ.get("MAX_RESIDENT_MODELS", "3"))
+
+_models = OrderedDict()         # (task, model) -> entry dict, most recently used last
+_models_lock = threading.Lock()
+_load_locks = {}                # (task, model) -> lock, so a model is never loaded twice at once
+
+
+def _model_memory_bytes(pipe):
+    """Size of the model's parameters and buffers in bytes (0 if unknown)"""
+    model = getattr(pipe, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    total += sum(b.numel() * b.element_size() for b in model.buffers())
+    return total
+
+
+def get_pipeline(task: str, model: str):
+    """
+    Return the pipeline for (task, model), loading it on first use.
+    Safe to call from several Streamlit sessions at the same time.
+    """
+    key = (task, model)
+
+    with _models_lock:
+        entry = _models.get(key)
+        if entry is not None:
+            _models.move_to_end(key)
+            entry["last_used"] = time.time()
+            entry["hits"] += 1
+            return entry["pipeline"]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # another session may have finished loading it while we waited
+        with _models_lock:
+            entry = _models.get(key)
+            if entry is not None:
+                _models.move_to_end(key)
+                entry["last_used"] = time.time()
+                entry["hits"] += 1
+                return entry["pipeline"]
+
+        start = time.perf_counter()
+        from transformers import pipeline
+        pipe = pipeline(task, model=model)
+        entry = {
+            "pipeline": pipe,
+            "memory_bytes": _model_memory_bytes(pipe),
+            "load_seconds": time.perf_counter() - start,
+            "last_used": time.time(),
+            "hits": 0,
+        }
+
+        record("model_load", entry["load_seconds"])
+        with _models_lock:
+            _models[key] = entry
+            evicted = []
+            while len(_models) > max(1, MAX_RESIDENT_MODELS):
+                evicted.append(_models.popitem(last=False))
+
+    if evicted:
+        del evicted
+        gc.collect()
+
+    return pipe
+
+
+def warm_models(models=(GENERATION_MODEL, QA_MODEL)):
+    """Load the given (task, model) pairs now instead of on the first question"""
+    for task, model in models:
+        get_pipeline(task, model)
+
+
+_warm_thread = None
+
+
+def warm_models_in_background(models=(GENERATION_MODEL, QA_MODEL)):
+    """
+    Start warm_models on a daemon thread so the page can render meanwhile.
+    Only the first call per process starts a thread; later calls return it.
+    """
+    global _warm_thread
+    with _models_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=warm_models, args=(models,), daemon=True)
+            _warm_thread.start()
+        return _warm_thread
+
+
+def resident_models():
+    """List the loaded pipelines, most recently used first, with their memory use"""
+    with _models_lock:
+        items = list(_models.items())
+    return [
+        {
+            "task": task,
+            "model": model,
+            "memory_mb": round(entry["memory_bytes"] / 1024 / 1024, 1),
+            "load_seconds": round(entry["load_seconds"], 2),
+            "hits": entry["hits"],
+            "last_used": time.strftime("%H:%M:%S", time.localtime(entry["last_used"])),
+        }
+        for (task, model), entry in reversed(items)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Micro-batched generation
+# ---------------------------------------------------------------------------
+
+# Largest number of prompts generated in one padded batch
+GENERATION_BATCH_SIZE = int(os.environ.get("GENERATION_BATCH_SIZE", "8"))
+# How long the scheduler waits for more prompts after the first one arrives
+GENERATION_BATCH_WAIT_MS = float(os.environ.get("GENERATION_BATCH_WAIT_MS", "20"))
+# Streamed answers bypass the batcher; this many may generate at the same time
+MAX_STREAMED_GENERATIONS = int(os.environ.get("MAX_STREAMED_GENERATIONS", "2"))
+
+_stream_slots = threading.BoundedSemaphore(max(1, MAX_STREAMED_GENERATIONS))
+
+
+class GenerationBatcher:
+    """
+    Groups prompts that arrive close together into one model call.
+
+    Callers on any thread call generate(); a single scheduler thread takes the
+    first waiting prompt, keeps collecting for up to `max_wait_ms` (or until
+    `max_batch_size` prompts are waiting), runs them as one padded batch and
+    hands every caller its own answer. Prompts with different generation
+    arguments (e.g. max_length) are never mixed in a batch.
+    """
+
+    def __init__(self, task: str, model: str, max_batch_size: int = None, max_wait_ms: float = None):
+        self.task = task
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size or GENERATION_BATCH_SIZE)
+        self.max_wait = (GENERATION_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.queue = queue.Queue()
+        self.held = []            # items taken off the queue that did not fit the last batch
+        self.stats = {"batches": 0, "prompts": 0, "largest_batch": 0}
+        self.thread = threading.Thread(target=self._loop, daemon=True, name=f"batcher-{model}")
+        self.thread.start()
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        """Generate text for one prompt; blocks until its batch has run"""
+        future = Future()
+        self.queue.put((prompt, kwargs, future))
+        return future.result()
+
+    def _collect(self):
+        """Wait for a prompt, then gather compatible ones until the window closes"""
+        first = self.held.pop(0) if self.held else self.queue.get()
+        key = sorted(first[1].items())
+        batch = [first]
+
+        # prompts left over from the previous round go first
+        still_held = []
+        for item in self.held:
+            if len(batch) < self.max_batch_size and sorted(item[1].items()) == key:
+                batch.append(item)
+            else:
+                still_held.append(item)
+        self.held = still_held
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if sorted(item[1].items()) == key:
+                batch.append(item)
+            else:
+                self.held.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            prompts = [prompt for prompt, _, _ in batch]
+            kwargs = batch[0][1]
+            try:
+                pipe = get_pipeline(self.task, self.model)
+                with trace("generate", size=len(prompts)):
+                    outputs = pipe(prompts, batch_size=len(prompts), **kwargs)
+                for (_, _, future), output in zip(batch, outputs):
+                    # a list input gives one list of candidates per prompt
+                    if isinstance(output, list):
+                        output = output[0]
+                    future.set_result(output["generated_text"])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.stats["batches"] += 1
+            self.stats["prompts"] += len(batch)
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+
+_batchers = {}
+
+
+def get_batcher(task: str, model: str) -> GenerationBatcher:
+    """The shared batcher for a (task, model) pair, created on first use"""
+    with _models_lock:
+        batcher = _batchers.get((task, model))
+        if batcher is None:
+            batcher = GenerationBatcher(task, model)
+            _batchers[(task, model)] = batcher
+        return batcher
+
+
+def generate_text(prompt: str, model=GENERATION_MODEL, **kwargs) -> str:
+    """Generate with the shared flan-t5 batcher, e.g. generate_text(prompt, max_length=150)"""
+    return get_batcher(*model).generate(prompt, **kwargs)
+
+
+def batching_stats():
+    """Batch counters per model, including the average batch size"""
+    with _models_lock:
+        batchers = list(_batchers.values())
+    return [
+        {
+            "model": b.model,
+            **b.stats,
+            "average_batch": round(b.stats["prompts"] / b.stats["batches"], 2) if b.stats["batches"] else 0,
+            "max_batch_size": b.max_batch_size,
+            "max_wait_ms": b.max_wait * 1000,
+        }
+        for b in batchers
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Token streaming
+# ---------------------------------------------------------------------------
+
+def _stop_when_cancelled(event):
+    """Stopping criteria that end generation once `event` is set"""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopWhenCancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return event.is_set()
+
+    return StoppingCriteriaList([StopWhenCancelled()])
+
+
+def stream_text(prompt: str, model=GENERATION_MODEL, cancel_event=None, **kwargs):
+    """
+    Generate for one prompt and yield the text piece by piece as tokens are
+    produced (e.g. for st.write_stream). Setting `cancel_event` stops the model
+    after the current token.
+
+    Streamed prompts are not batched with others, so at most
+    MAX_STREAMED_GENERATIONS of them run at once; the rest wait their turn.
+    """
+    from transformers import TextIteratorStreamer
+
+    pipe = get_pipeline(*model)
+    inputs = pipe.tokenizer(prompt, return_tensors="pt", truncation=True)
+    streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generate_kwargs = dict(inputs, streamer=streamer, **kwargs)
+    if cancel_event is not None:
+        generate_kwargs["stopping_criteria"] = _stop_when_cancelled(cancel_event)
+
+    errors = []
+
+    def run():
+        try:
+            pipe.model.generate(**generate_kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # unblock the reader below
+        finally:
+            # freed when the model stops, even if nobody reads the rest of the stream
+            _stream_slots.release()
+
+    start = time.perf_counter()
+    while not _stream_slots.acquire(timeout=0.1):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+    record("generate_stream_wait", time.perf_counter() - start)
+    thread = threading.Thread(target=run, daemon=True, name="stream-generate")
+    try:
+        thread.start()
+    except BaseException:
+        _stream_slots.release()
+        raise
+    for text in timed_iter("generate_stream", streamer):
+        if text:
+            yield text
+    thread.join()
+    if errors:
+        raise errors[0]
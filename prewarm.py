@@ -0,0 +1,52 @@
+"""
+Background import of the heavy libraries.
+
+The app modules import docling, transformers, chromadb and friends only when
+a feature first needs them, so the page comes up quickly. The first upload or
+question then pays the import instead. prewarm_in_background() does those
+imports on a daemon thread right after start-up, so they are usually done by
+the time anyone clicks; the page itself never waits for them.
+
+Import times are recorded in telemetry as "import <module>".
+"""
+import importlib
+import threading
+
+from telemetry import trace
+from vector_store import import_chromadb
+
+
+# What the apps import lazily, roughly in the order they are needed
+HEAVY_MODULES = (
+    "chromadb",
+    "sentence_transformers",
+    "transformers",
+    "docling.document_converter",
+    "docling.datamodel.pipeline_options",
+)
+
+_started = False
+_lock = threading.Lock()
+
+
+def prewarm(modules=HEAVY_MODULES):
+    """Import the modules now (a failed import is printed, not raised)"""
+    for name in modules:
+        try:
+            with trace(f"import {name}"):
+                if name == "chromadb":
+                    import_chromadb()       # needs the sqlite3 swap first
+                else:
+                    importlib.import_module(name)
+        except Exception as e:
+            print(f"Could not prewarm {name}: {e}")
+
+
+def prewarm_in_background(modules=HEAVY_MODULES):
+    """Start prewarm() on a daemon thread, once per process"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=prewarm, args=(modules,), daemon=True, name="prewarm-imports").start()
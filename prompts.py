@@ -0,0 +1,184 @@
+"""
+Packing retrieved chunks into a model's context window.
+
+Retrieved chunks used to be joined as they came, without counting tokens, so
+flan-t5 silently truncated long prompts and the distilbert QA pipeline fell
+back to slow sliding-window passes. pack_chunks() takes the chunks in ranking
+order, drops near-duplicates (neighbouring chunks share a 100-character
+overlap) and keeps adding chunks while they fit in a token budget:
+
+    packed = pack_chunks(docs, metadatas, GENERATION_MODEL, budget=512, template=...)
+    packed.text, packed.tokens
+
+Chunk token counts are cached by content, so a popular chunk is tokenized once
+per process.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# Input tokens available to flan-t5 for the whole prompt (its encoder limit is 512)
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "512"))
+# Input tokens available to the distilbert QA model for question + context
+QA_TOKEN_BUDGET = int(os.environ.get("QA_TOKEN_BUDGET", "384"))
+# How many chunks are retrieved as candidates for packing
+PROMPT_CANDIDATES = int(os.environ.get("PROMPT_CANDIDATES", "8"))
+# Chunks whose word trigrams overlap this much with a better ranked chunk are dropped
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# How many chunk token counts are remembered
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "20000"))
+
+# What pack_chunks() decided. `chunks` are the kept (text, metadata) pairs in
+# ranking order, `tokens` the prompt length, `budget` what it had to fit in.
+PackedContext = namedtuple("PackedContext", "text chunks tokens budget dropped_duplicates dropped_budget")
+
+_token_counts = OrderedDict()   # (model name, sha256 of text) -> token count
+_tokenizers = {}                # model name -> tokenizer
+_tokenizer_errors = {}          # model name -> why it could not be loaded (not retried)
+_lock = threading.Lock()
+_WORD = re.compile(r"\w+")
+
+
+def get_tokenizer(model):
+    """
+    The tokenizer of a (task, model) pair from models.py, loaded on its own
+    (not the whole pipeline) and kept for the life of the process. A tokenizer
+    that failed to load is not tried again; the same error is raised.
+    """
+    name = model[1]
+    with _lock:
+        tokenizer = _tokenizers.get(name)
+        error = _tokenizer_errors.get(name)
+    if error is not None:
+        raise error
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(name)
+        except Exception as e:
+            with _lock:
+                _tokenizer_errors[name] = e
+            raise
+        with _lock:
+            tokenizer = _tokenizers.setdefault(name, tokenizer)
+    return tokenizer
+
+
+def count_tokens(text: str, model, chunk_hash: str = None) -> int:
+    """
+    Number of tokens in `text` for the model (without special tokens), cached.
+    Pass the chunk's stored `chunk_hash` to skip hashing the text again.
+    """
+    return count_tokens_batch([text], model, [chunk_hash])[0]
+
+
+def count_tokens_batch(texts, model, chunk_hashes=None):
+    """Like count_tokens for a list of texts; the uncached ones are tokenized in one call"""
+    chunk_hashes = chunk_hashes or [None] * len(texts)
+    keys = [(model[1], h or hashlib.sha256(text.encode("utf-8")).hexdigest())
+            for text, h in zip(texts, chunk_hashes)]
+    counts = [None] * len(texts)
+    with _lock:
+        for i, key in enumerate(keys):
+            count = _token_counts.get(key)
+            if count is not None:
+                _token_counts.move_to_end(key)
+                counts[i] = count
+
+    missing = [i for i, count in enumerate(counts) if count is None]
+    if missing:
+        encoded = get_tokenizer(model)([texts[i] for i in missing], add_special_tokens=False)["input_ids"]
+        with _lock:
+            for i, ids in zip(missing, encoded):
+                counts[i] = _token_counts[keys[i]] = len(ids)
+            while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+                _token_counts.popitem(last=False)
+    return counts
+
+
+def token_cache_info():
+    with _lock:
+        return {"size": len(_token_counts), "max_size": TOKEN_COUNT_CACHE_SIZE}
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _overlap(a, b):
+    """Share of the smaller shingle set that is also in the other one"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _trim_overlap(previous: str, text: str, max_overlap: int = 200) -> str:
+    """Drop the start of `text` that repeats the end of `previous` (splitter overlap)"""
+    for size in range(min(max_overlap, len(previous), len(text)), 20, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+
+def remove_near_duplicates(docs, metadatas):
+    """
+    Keep chunks in order, dropping ones that mostly repeat a better ranked
+    chunk and trimming the text a chunk shares with its neighbour in the same
+    document. Returns (kept (text, metadata) pairs, number dropped).
+    """
+    kept, kept_shingles, dropped = [], [], 0
+    for text, metadata in zip(docs, metadatas):
+        metadata = metadata or {}
+        shingles = _shingles(text)
+        if any(_overlap(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in kept_shingles):
+            dropped += 1
+            continue
+        for other_text, other_meta in kept:
+            if (other_meta.get("filename") == metadata.get("filename")
+                    and other_meta.get("chunk_index") == metadata.get("chunk_index", -2) - 1):
+                text = _trim_overlap(other_text, text)
+                break
+        kept.append((text, metadata))
+        kept_shingles.append(shingles)
+    return kept, dropped
+
+
+def pack_chunks(docs, metadatas, model, budget: int, template: str = "{context}",
+                label: str = "Document {n}: ", separator: str = "\n\n", **fields):
+    """
+    Fill `template` (formatted with context= and **fields) with as many of the
+    ranked chunks as fit in `budget` tokens. A chunk that does not fit is
+    skipped and the next, shorter one is tried.
+    """
+    chunks, dropped_duplicates = remove_near_duplicates(docs, metadatas)
+
+    # Fixed cost of the template and one special end-of-sequence token
+    used = count_tokens(template.format(context="", **fields), model) + 1
+    label_tokens = count_tokens(label.format(n=1) + separator, model)
+
+    selected, dropped_budget = [], 0
+    for text, metadata in chunks:
+        # the stored hash only matches if the text was not trimmed
+        chunk_hash = metadata.get("chunk_hash") if metadata.get("chunk_size") == len(text) else None
+        cost = label_tokens + count_tokens(text, model, chunk_hash)
+        if used + cost > budget:
+            dropped_budget += 1
+            continue
+        selected.append((text, metadata))
+        used += cost
+
+    context = separator.join(label.format(n=i + 1) + text for i, (text, _) in enumerate(selected))
+    return PackedContext(
+        text=template.format(context=context, **fields),
+        chunks=selected,
+        tokens=used,
+        budget=budget,
+        dropped_duplicates=dropped_duplicates,
+        dropped_budget=dropped_budget,
+    )
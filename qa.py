@@ -0,0 +1,179 @@
+"""
+Answering questions from the document collection.
+
+Both functions are plain (no Streamlit calls), so they can run on the answer
+worker threads in answer_service.py or be called from scripts and benchmarks.
+"""
+import time
+
+import answer_cache
+from models import GENERATION_MODEL, QA_MODEL, generate_text, get_pipeline, stream_text
+from prompts import PROMPT_CANDIDATES, PROMPT_TOKEN_BUDGET, QA_TOKEN_BUDGET, count_tokens, pack_chunks
+from rerank import RERANK_CANDIDATES, RERANK_ENABLED, rerank
+from retrieval import retrieve
+from telemetry import trace
+
+
+PROMPT_TEMPLATE = """Context information:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+
+def _report(info, packed):
+    """Copy what went into the prompt to the caller's `info` dict"""
+    if info is not None:
+        info.update(
+            prompt_tokens=packed.tokens,
+            token_budget=packed.budget,
+            chunks_used=len(packed.chunks),
+            chunks_dropped=packed.dropped_duplicates + packed.dropped_budget,
+        )
+
+
+def _timings(info):
+    """Where the per-stage milliseconds go: info['timings'], or nowhere"""
+    return info.setdefault("timings", {}) if info is not None else {}
+
+
+def get_answer(collection, question, info=None):
+    """
+    This function retrieves the answer to a question from the document database
+    """
+    # Get the question-answering pipeline (loaded once per process)
+    qa_pipeline = get_pipeline(*QA_MODEL)
+    
+    # Retrieve relevant documents from the collection (vector + keyword search)
+    results = retrieve(collection, question, n_results=PROMPT_CANDIDATES, timings=_timings(info))
+    
+    # Check if we have any results
+    if not results.docs:
+        return "I don't have enough information to answer that question. Please upload some Queen-related documents first!"
+    
+    # Combine the best documents into a context that fits next to the question
+    # in one pass of the model (no sliding window)
+    budget = QA_TOKEN_BUDGET - count_tokens(question, QA_MODEL) - 2
+    packed = pack_chunks(results.docs, results.metadatas, QA_MODEL,
+                         budget=budget, label="", separator=" ")
+    _report(info, packed)
+    context = packed.text
+    
+    # Check if context is too short
+    if len(context.strip()) < 10:
+        return "I don't have enough information to answer that question. Please upload some Queen-related documents first!"
+    
+    # Get the answer using the QA pipeline
+    with trace("qa_pipeline"):
+        answer = qa_pipeline(question=question, context=context, max_seq_len=QA_TOKEN_BUDGET)
+    
+    return answer['answer']
+
+
+def build_prompt_with_source(collection, question, info=None):
+    """
+    Retrieve the best chunks for a question and pack as many as fit in
+    PROMPT_TOKEN_BUDGET into the generation prompt.
+    Returns (prompt, source), or (None, None) when nothing relevant was found
+    """
+    timings = _timings(info)
+    
+    # Vector search (same embedding model as ingest) fused with keyword search.
+    # With reranking on, fetch more candidates and let the cross-encoder pick
+    n_results = RERANK_CANDIDATES if RERANK_ENABLED else PROMPT_CANDIDATES
+    results = retrieve(collection, question, n_results=n_results, timings=timings)
+    
+    docs = results.docs
+    metadatas = results.metadatas  # This tells us which document
+    
+    if not docs or not results.relevant:
+        return None, None
+    
+    if RERANK_ENABLED:
+        start = time.perf_counter()
+        with trace("rerank", size=len(docs)):
+            order, status = rerank(question, docs)
+        docs = [docs[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+        timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        if info is not None:
+            info["rerank"] = status
+    
+    start = time.perf_counter()
+    packed = pack_chunks(docs, metadatas, GENERATION_MODEL, budget=PROMPT_TOKEN_BUDGET,
+                         template=PROMPT_TEMPLATE, question=question)
+    timings["pack_ms"] = (time.perf_counter() - start) * 1000
+    _report(info, packed)
+    
+    # Extract source from best matching document
+    best_metadata = packed.chunks[0][1] if packed.chunks else metadatas[0]
+    best_metadata = best_metadata or {}
+    best_source = best_metadata.get("filename", "Unknown")
+    if best_metadata.get("heading"):
+        best_source += f" ({best_metadata['heading']})"
+    
+    return packed.text, best_source
+
+
+NO_INFORMATION = "I don't have information about that topic."
+
+
+# Enhanced answer function with source tracking
+def get_answer_with_source(collection, question, info=None):
+    """
+    Enhanced answer function that shows source document.
+    Pass an `info` dict to get the prompt's token count and chunks back
+    """
+    # Repeated questions are answered from the cache until the documents change
+    cached = answer_cache.get(collection, question)
+    if cached is not None:
+        if info is not None:
+            info["cached"] = True
+        return cached
+    
+    prompt, best_source = build_prompt_with_source(collection, question, info)
+    if prompt is None:
+        return NO_INFORMATION, "No source"
+    
+    # Generation is shared: prompts from concurrent users run together in one batch
+    start = time.perf_counter()
+    answer = generate_text(prompt, max_length=150).strip()
+    _timings(info)["generate_ms"] = (time.perf_counter() - start) * 1000
+    
+    answer_cache.put(collection, question, answer, best_source)
+    return answer, best_source
+
+
+def stream_answer_with_source(collection, question, on_token=None, cancel_event=None, info=None):
+    """
+    Same as get_answer_with_source, but hands each piece of the answer to
+    on_token(text) as soon as the model produces it
+    """
+    cached = answer_cache.get(collection, question)
+    if cached is not None:
+        if info is not None:
+            info["cached"] = True
+        if on_token:
+            on_token(cached[0])
+        return cached
+    
+    prompt, best_source = build_prompt_with_source(collection, question, info)
+    if prompt is None:
+        if on_token:
+            on_token(NO_INFORMATION)
+        return NO_INFORMATION, "No source"
+    
+    start = time.perf_counter()
+    pieces = []
+    for piece in stream_text(prompt, cancel_event=cancel_event, max_length=150):
+        pieces.append(piece)
+        if on_token:
+            on_token(piece)
+    answer = "".join(pieces).strip()
+    _timings(info)["generate_ms"] = (time.perf_counter() - start) * 1000
+    
+    # A cancelled generation stopped early, so its answer is incomplete
+    if cancel_event is None or not cancel_event.is_set():
+        answer_cache.put(collection, question, answer, best_source)
+    return answer, best_source
@@ -0,0 +1,102 @@
+"""
+Optional cross-encoder reranking of retrieved chunks.
+
+With RERANK_ENABLED=1, the answer functions retrieve RERANK_CANDIDATES chunks
+instead of a handful. A small cross-encoder then scores every (question, chunk)
+pair in one batched forward pass and the best ones go into the prompt.
+
+Reranking has a hard latency budget (RERANK_BUDGET_MS). If the scores are not
+back in time, or the model is still loading, or every reranker slot is busy,
+the chunks keep their retrieval order, so turning it on cannot blow up answer
+latency. Whatever happened is reported in the returned `status`.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+
+
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# How many chunks are retrieved to be reranked
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))
+# Give up on reranking (and keep retrieval order) after this many milliseconds
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "150"))
+# How many rerank passes may run at once; more requests fall back straight away
+RERANK_WORKERS = int(os.environ.get("RERANK_WORKERS", "2"))
+
+_model = None
+_load_error = None
+_model_lock = threading.Lock()
+_loading = threading.Event()
+_executor = ThreadPoolExecutor(max_workers=RERANK_WORKERS + 1, thread_name_prefix="rerank")
+_slots = threading.BoundedSemaphore(RERANK_WORKERS)
+
+
+def _load_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            _model = CrossEncoder(RERANK_MODEL)
+        return _model
+
+
+def _load_in_background():
+    global _load_error
+    try:
+        _load_model()
+    except Exception as e:
+        _load_error = e
+        print(f"Could not load reranker {RERANK_MODEL}: {e}")
+
+
+def get_reranker(wait: bool = True):
+    """
+    The cross-encoder, loaded once per process. With wait=False it is loaded
+    in the background and None is returned until it is ready.
+    """
+    if _model is not None or wait:
+        return _load_model()
+    if not _loading.is_set():
+        _loading.set()
+        _executor.submit(_load_in_background)
+    return None
+
+
+def _score(model, question, docs):
+    try:
+        return model.predict([(question, doc) for doc in docs], batch_size=len(docs))
+    finally:
+        _slots.release()
+
+
+def rerank(question: str, docs, budget_ms: float = None):
+    """
+    New order of `docs` for the question, best first, as a list of indexes,
+    and a status: 'reranked', 'loading', 'unavailable', 'busy', 'over budget'
+    or 'failed'.
+    Apart from 'reranked' the order is unchanged.
+    """
+    unchanged = list(range(len(docs)))
+    if len(docs) < 2:
+        return unchanged, "reranked"
+
+    model = get_reranker(wait=False)
+    if model is None:
+        return unchanged, "unavailable" if _load_error else "loading"
+    if not _slots.acquire(blocking=False):
+        return unchanged, "busy"
+
+    budget_ms = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    future = _executor.submit(_score, model, question, list(docs))
+    try:
+        scores = future.result(timeout=budget_ms / 1000)
+    except TimeoutError:
+        # The pass finishes in the background and frees its slot then
+        return unchanged, "over budget"
+    except Exception as e:
+        print(f"Reranking failed: {e}")
+        return unchanged, "failed"
+    return [int(i) for i in np.argsort(-np.asarray(scores), kind="stable")], "reranked"
@@ -0,0 +1,116 @@
+"""
+Finding the chunks that answer a question.
+
+The vector search (same embedding model as ingest) and the BM25 keyword index
+(keyword_index.py) each rank candidates, and the two rankings are merged with
+reciprocal-rank fusion: a chunk scores sum(1 / (RRF_K + rank)) over the lists
+it appears in, so chunks found by both searches come first and an exact
+keyword match can still make it when the vectors miss it.
+
+Set HYBRID_RETRIEVAL=0 to use the vector search alone, and RETRIEVAL_BACKEND=numpy
+to run the vector search on the in-process matrix of dense_index.py instead of
+through Chroma's query.
+"""
+import os
+import time
+from collections import namedtuple
+
+from dense_index import RETRIEVAL_BACKEND, get_dense_index
+from embeddings import embed_query
+from keyword_index import get_keyword_index
+from telemetry import trace
+
+
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "1") == "1"
+# Damping constant of reciprocal-rank fusion (60 is the usual choice)
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Vector matches further away than this do not count as relevant on their own
+MAX_VECTOR_DISTANCE = float(os.environ.get("MAX_VECTOR_DISTANCE", "1.5"))
+# Keyword matches must contain at least this share of the question's words
+KEYWORD_MIN_COVERAGE = float(os.environ.get("KEYWORD_MIN_COVERAGE", "0.5"))
+
+# Chunks in final ranking order. `relevant` is False when neither search found
+# anything close enough to be worth answering from.
+Retrieved = namedtuple("Retrieved", "ids docs metadatas relevant")
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Merge ranked id lists into one ranking (best first)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _where(filenames):
+    if filenames is None:
+        return None
+    return {"filename": filenames[0]} if len(filenames) == 1 else {"filename": {"$in": list(filenames)}}
+
+
+def vector_search(collection, question: str, n_results: int, filenames=None, backend: str = None):
+    """
+    The nearest chunks as (ids, {id: (text, metadata)}, distances), through
+    Chroma or the NumPy index. `filenames` limits the search to those documents.
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    embedding = embed_query(question)
+    index = get_dense_index(collection) if backend == "numpy" else None
+    if index is None:
+        with trace("query", size=n_results):
+            results = collection.query(query_embeddings=[embedding], n_results=n_results, where=_where(filenames))
+        ids = results["ids"][0]
+        found = dict(zip(ids, zip(results["documents"][0], results["metadatas"][0])))
+        return ids, found, results["distances"][0]
+
+    with trace("query_numpy", size=n_results):
+        hits = index.search(embedding, n_results, filenames=filenames)
+    ids = [id_ for id_, _ in hits]
+    stored = collection.get(ids=ids, include=["documents", "metadatas"]) if ids else {"ids": []}
+    found = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"])))
+    ids_and_distances = [(id_, distance) for id_, distance in hits if id_ in found]
+    return [i for i, _ in ids_and_distances], found, [d for _, d in ids_and_distances]
+
+
+def retrieve(collection, question: str, n_results: int = 8, hybrid: bool = None, timings=None,
+             filenames=None):
+    """
+    The n_results best chunks for a question, from vector and keyword search,
+    optionally only from the documents in `filenames`.
+    Milliseconds spent per search are added to the `timings` dict if given
+    """
+    hybrid = HYBRID_RETRIEVAL if hybrid is None else hybrid
+    timings = {} if timings is None else timings
+
+    start = time.perf_counter()
+    ids, found, distances = vector_search(collection, question, n_results, filenames)
+    timings["vector_ms"] = (time.perf_counter() - start) * 1000
+    vector_relevant = bool(ids) and min(distances) <= MAX_VECTOR_DISTANCE
+    if not hybrid:
+        return Retrieved(ids, [found[i][0] for i in ids], [found[i][1] for i in ids], vector_relevant)
+
+    start = time.perf_counter()
+    with trace("keyword_search", size=n_results):
+        keyword_hits = get_keyword_index(collection).search(question, n_results, min_coverage=KEYWORD_MIN_COVERAGE)
+    keyword_ids = [id_ for id_, _ in keyword_hits]
+    if filenames is not None:
+        # The keyword index is not filtered; chunk ids start with their filename (ingest.chunk_id)
+        keyword_ids = [id_ for id_ in keyword_ids if id_.rsplit("_chunk_", 1)[0] in filenames]
+    ranked = reciprocal_rank_fusion([ids, keyword_ids])[:n_results]
+
+    # Keyword-only hits still need their text and metadata
+    missing = [id_ for id_ in ranked if id_ not in found]
+    if missing:
+        extra = collection.get(ids=missing, include=["documents", "metadatas"])
+        for id_, doc, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            found[id_] = (doc, metadata)
+    ranked = [id_ for id_ in ranked if id_ in found]
+    timings["keyword_ms"] = (time.perf_counter() - start) * 1000
+
+    return Retrieved(
+        ranked,
+        [found[i][0] for i in ranked],
+        [found[i][1] for i in ranked],
+        vector_relevant or bool(keyword_ids),
+    )
@@ -0,0 +1,222 @@
+"""
+Lightweight per-stage latency tracing.
+
+Each stage of the pipeline (convert, split, embed, store, query, generate,
+render, ...) records how long every call took, optionally how big it was and
+whether a cache answered it:
+
+    with trace("query", size=n_results):
+        collection.query(...)
+
+    record("convert", seconds, size=file_bytes, cache_hit=True)
+
+Durations go into a fixed-bucket histogram (cumulative, Prometheus style) and a
+rolling window of the last TELEMETRY_WINDOW calls, which gives the p50/p95/p99
+shown in final_app's Performance tab. Recording is a lock and a few additions,
+so it is cheap enough to leave on. Everything is per process.
+
+snapshot() returns plain dicts, prometheus_text() the Prometheus text format.
+With TELEMETRY_EXPORT_FILE set, the numbers are also written to that file
+(Prometheus if it ends in .prom, JSON otherwise) every TELEMETRY_EXPORT_SECONDS.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# How many recent calls per stage the percentiles are computed over
+TELEMETRY_WINDOW = int(os.environ.get("TELEMETRY_WINDOW", "1000"))
+TELEMETRY_EXPORT_FILE = os.environ.get("TELEMETRY_EXPORT_FILE", "")
+TELEMETRY_EXPORT_SECONDS = float(os.environ.get("TELEMETRY_EXPORT_SECONDS", "15"))
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+_stages = {}
+_lock = threading.Lock()
+_last_export = 0.0
+
+
+class _Stage:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.errors = 0
+        self.recent = deque(maxlen=TELEMETRY_WINDOW)
+
+
+def record(stage: str, seconds: float, size: int = None, cache_hit: bool = None, error: bool = False):
+    """Add one call of `stage` that took `seconds`"""
+    with _lock:
+        s = _stages.get(stage)
+        if s is None:
+            s = _stages[stage] = _Stage()
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                s.buckets[i] += 1
+                break
+        s.count += 1
+        s.total_seconds += seconds
+        s.max_seconds = max(s.max_seconds, seconds)
+        s.recent.append(seconds)
+        if size is not None:
+            s.total_size += size
+        if cache_hit is True:
+            s.cache_hits += 1
+        elif cache_hit is False:
+            s.cache_misses += 1
+        if error:
+            s.errors += 1
+    if TELEMETRY_EXPORT_FILE:
+        _maybe_export()
+
+
+class _Span:
+    """What a trace() block can fill in before it ends"""
+    __slots__ = ("size", "cache_hit")
+
+    def __init__(self, size, cache_hit):
+        self.size = size
+        self.cache_hit = cache_hit
+
+
+@contextmanager
+def trace(stage: str, size: int = None, cache_hit: bool = None):
+    """
+    Time the block as one call of `stage`. The size and cache hit can also be
+    set on the yielded span once they are known.
+    """
+    span = _Span(size, cache_hit)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield span
+    except Exception:
+        # BaseExceptions (st.rerun, st.stop, Ctrl-C) are control flow, not errors
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, span.size, span.cache_hit, error=error)
+
+
+def timed_iter(stage: str, iterable):
+    """
+    Yield from `iterable`, recording the time spent producing its items (not
+    the time the consumer spends on them) as one call of `stage`
+    """
+    spent, items = 0.0, 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - start
+                break
+            spent += time.perf_counter() - start
+            items += 1
+            yield item
+    finally:
+        record(stage, spent, size=items)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def snapshot():
+    """One dict per stage with counts, sizes, cache hits and latency percentiles (ms)"""
+    with _lock:
+        stages = {name: (s.count, s.total_seconds, s.max_seconds, s.total_size, s.cache_hits,
+                         s.cache_misses, s.errors, list(s.recent), list(s.buckets))
+                  for name, s in _stages.items()}
+    rows = []
+    for name, (count, total, maximum, size, hits, misses, errors, recent, buckets) in sorted(stages.items()):
+        rows.append({
+            "stage": name,
+            "calls": count,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": _percentile(recent, 50) * 1000,
+            "p95_ms": _percentile(recent, 95) * 1000,
+            "p99_ms": _percentile(recent, 99) * 1000,
+            "max_ms": maximum * 1000,
+            "total_s": total,
+            "size": size,
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "errors": errors,
+            "buckets": dict(zip(("+Inf" if b == float("inf") else str(b) for b in BUCKETS), buckets)),
+        })
+    return rows
+
+
+def prometheus_text(prefix: str = "streamlitai"):
+    """All stages in the Prometheus text exposition format"""
+    lines = [
+        f"# HELP {prefix}_stage_duration_seconds Time spent per call of a pipeline stage",
+        f"# TYPE {prefix}_stage_duration_seconds histogram",
+    ]
+    rows = snapshot()
+    for row in rows:
+        cumulative = 0
+        for bound, n in row["buckets"].items():
+            cumulative += n
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{row["stage"]}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{row["stage"]}"}} {row["total_s"]}')
+        lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{row["stage"]}"}} {row["calls"]}')
+    for metric, key, help_text in (
+        ("stage_size_total", "size", "Items or bytes processed per stage"),
+        ("stage_cache_hits_total", "cache_hits", "Calls answered by a cache"),
+        ("stage_cache_misses_total", "cache_misses", "Calls that missed a cache"),
+        ("stage_errors_total", "errors", "Calls that raised"),
+    ):
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for row in rows:
+            lines.append(f'{prefix}_{metric}{{stage="{row["stage"]}"}} {row[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def snapshot_json():
+    return json.dumps({"generated_at": time.time(), "stages": snapshot()}, indent=2)
+
+
+def export(path: str):
+    """Write the current numbers to `path` (.prom: Prometheus text, else JSON)"""
+    path = Path(path)
+    text = prometheus_text() if path.suffix == ".prom" else snapshot_json()
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _maybe_export():
+    global _last_export
+    now = time.time()
+    with _lock:
+        if now - _last_export < TELEMETRY_EXPORT_SECONDS:
+            return
+        _last_export = now
+    try:
+        export(TELEMETRY_EXPORT_FILE)
+    except OSError as e:
+        print(f"Could not write telemetry to {TELEMETRY_EXPORT_FILE}: {e}")
+
+
+def reset():
+    """Forget everything recorded so far"""
+    with _lock:
+        _stages.clear()
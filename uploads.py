@@ -0,0 +1,135 @@
+"""
+Scratch space for uploaded files.
+
+docling needs a real file path, so uploads have to land on disk. Instead of
+up.getvalue() (a full extra copy of every file in memory) and temp files that
+are never removed, uploads are streamed in blocks into a per-batch directory
+that is deleted as soon as the batch is done:
+
+    with ScratchSpace() as scratch:
+        path = scratch.save(uploaded_file)
+        ...
+    # files are gone here
+
+All batches in the process share a disk quota (SCRATCH_QUOTA_MB).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "queen_uploads"))
+SCRATCH_QUOTA_MB = float(os.environ.get("SCRATCH_QUOTA_MB", "2048"))
+
+# Batch directories older than this are left over from a crash and get removed
+STALE_AFTER_SECONDS = 24 * 60 * 60
+
+BLOCK_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+_used_bytes = 0
+_stale_checked = False
+
+
+class ScratchQuotaExceeded(Exception):
+    """Raised when saving an upload would go over SCRATCH_QUOTA_MB"""
+
+
+def _reserve(nbytes):
+    global _used_bytes
+    with _lock:
+        if _used_bytes + nbytes > SCRATCH_QUOTA_MB * 1024 * 1024:
+            raise ScratchQuotaExceeded(
+                f"Upload scratch space is full ({SCRATCH_QUOTA_MB:.0f} MB); try a smaller batch"
+            )
+        _used_bytes += nbytes
+
+
+def _release(nbytes):
+    global _used_bytes
+    with _lock:
+        _used_bytes = max(0, _used_bytes - nbytes)
+
+
+def _remove_stale_batches():
+    """Delete batch directories left behind by a previous crash (once per process)"""
+    global _stale_checked
+    with _lock:
+        if _stale_checked:
+            return
+        _stale_checked = True
+    cutoff = time.time() - STALE_AFTER_SECONDS
+    for batch_dir in Path(SCRATCH_DIR).glob("batch_*"):
+        try:
+            if batch_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(batch_dir, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+class ScratchSpace:
+    """A temporary directory for one batch of uploads, removed on exit"""
+
+    def __init__(self):
+        self.path = None
+        self.digests = {}      # saved path -> sha256 of its content
+        self.reserved = 0
+
+    def __enter__(self):
+        Path(SCRATCH_DIR).mkdir(parents=True, exist_ok=True)
+        _remove_stale_batches()
+        self.path = Path(tempfile.mkdtemp(prefix="batch_", dir=SCRATCH_DIR))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    def cleanup(self):
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        _release(self.reserved)
+        self.reserved = 0
+        self.digests = {}
+
+    def save(self, upload) -> str:
+        """
+        Stream a file-like upload (e.g. a Streamlit UploadedFile) to disk in
+        1 MB blocks and return its path. The sha256 of the content is kept in
+        `self.digests[path]`. Raises ScratchQuotaExceeded if there is no room.
+        """
+        size = getattr(upload, "size", None)
+        if size is not None:
+            _reserve(size)
+            self.reserved += size
+
+        # keep the extension (docling picks the format from it); mkstemp avoids name clashes
+        fd, path = tempfile.mkstemp(suffix=Path(upload.name).suffix, dir=self.path)
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            upload.seek(0)
+            for block in iter(lambda: upload.read(BLOCK_SIZE), b""):
+                if size is None:
+                    _reserve(len(block))
+                    self.reserved += len(block)
+                out.write(block)
+                digest.update(block)
+
+        self.digests[path] = digest.hexdigest()
+        return path
+
+    def remove(self, path: str):
+        """Delete one saved file early (e.g. when it turns out to be a duplicate)"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.digests.pop(path, None)
+        _release(size)
+        self.reserved -= size
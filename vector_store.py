@@ -0,0 +1,163 @@
+"""
+Process-wide ChromaDB access for the Q&A apps.
+
+By default the chunks are kept on disk with Chroma's PersistentClient, so the
+archive survives restarts and every session works on the same corpus.
+Set VECTOR_STORE_MODE=memory to get the old throw-away in-memory behaviour.
+
+Every collection records the embedding model its vectors came from, and
+opening one that was built with another model raises EmbeddingModelMismatch.
+
+chromadb is imported when the client is first needed.
+"""
+import os
+import sys
+import threading
+
+from corpus_stats import drop_corpus_stats, uncount_chunks
+from embeddings import EMBEDDING_MODEL_NAME
+from dense_index import drop_dense_index, forget_vectors
+from keyword_index import drop_index, forget_chunks
+
+
+# "persistent" (default) keeps data in CHROMA_PERSIST_DIR, "memory" loses it on restart
+VECTOR_STORE_MODE = os.environ.get("VECTOR_STORE_MODE", "persistent")
+CHROMA_PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR", "chroma_db")
+
+_client = None
+_collections = {}
+_versions = {}      # collection name -> number of writes made by this process
+_lock = threading.Lock()
+
+
+def import_chromadb():
+    """Import chromadb (once), swapping in pysqlite3 first if it is installed"""
+    # Fix SQLite version issue for ChromaDB on Streamlit Cloud: chromadb needs a
+    # newer sqlite3 than some hosts ship, pysqlite3-binary provides one
+    if "chromadb" not in sys.modules:
+        try:
+            __import__('pysqlite3')
+            sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+        except ImportError:
+            pass
+    import chromadb
+    return chromadb
+
+
+def get_client():
+    """Return the Chroma client shared by every rerun and session in this process"""
+    global _client
+    with _lock:
+        if _client is None:
+            chromadb = import_chromadb()
+            if VECTOR_STORE_MODE == "memory":
+                _client = chromadb.Client()
+            else:
+                _client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+        return _client
+
+
+class EmbeddingModelMismatch(ValueError):
+    """Raised when a collection holds vectors from a different embedding model"""
+
+
+def _check_embedding_model(collection):
+    """
+    Make sure the collection's vectors come from EMBEDDING_MODEL_NAME.
+    Collections from before models were recorded were all built with
+    all-MiniLM-L6-v2 (our ingest model and Chroma's default), so they are tagged.
+    """
+    metadata = dict(collection.metadata or {})
+    stored = metadata.get("embedding_model")
+    if stored is None:
+        metadata["embedding_model"] = EMBEDDING_MODEL_NAME
+        collection.modify(metadata=metadata)
+    elif stored != EMBEDDING_MODEL_NAME:
+        raise EmbeddingModelMismatch(
+            f"Collection '{collection.name}' was built with '{stored}' but this app embeds "
+            f"with '{EMBEDDING_MODEL_NAME}'. Reset the collection or use a different one."
+        )
+
+
+def get_collection(name: str = "documents"):
+    """Open (or create) a collection; reopening an existing one does not touch its data"""
+    client = get_client()
+    with _lock:
+        collection = _collections.get(name)
+        if collection is None:
+            collection = client.get_or_create_collection(
+                name=name,
+                metadata={"embedding_model": EMBEDDING_MODEL_NAME}
+            )
+            _check_embedding_model(collection)
+            _collections[name] = collection
+        return collection
+
+
+def bump_corpus_version(name: str = "documents"):
+    """Record that a collection's contents changed (called after every write)"""
+    with _lock:
+        _versions[name] = _versions.get(name, 0) + 1
+
+
+def corpus_version(name: str = "documents"):
+    """
+    A value that changes whenever documents are added to or removed from a
+    collection, for caches of answers computed from it. Writes from this
+    process bump a counter; the chunk count also catches most writes made by
+    other processes sharing the persistent store.
+    """
+    with _lock:
+        version = _versions.get(name, 0)
+    return version, get_collection(name).count()
+
+
+def reset_collection(collection_name: str = "documents"):
+    """Delete existing collection and create a new empty one"""
+    client = get_client()
+    with _lock:
+        _collections.pop(collection_name, None)
+        try:
+            client.delete_collection(name=collection_name)
+            print(f"Deleted collection '{collection_name}'")
+        except Exception:
+            print(f"Collection '{collection_name}' doesn't exist or already deleted")
+
+        collection = client.create_collection(
+            name=collection_name,
+            metadata={"embedding_model": EMBEDDING_MODEL_NAME}
+        )
+        _collections[collection_name] = collection
+        _versions[collection_name] = _versions.get(collection_name, 0) + 1
+    drop_index(collection_name)
+    drop_dense_index(collection_name)
+    drop_corpus_stats(collection_name)
+    print(f"Created new empty collection '{collection_name}'")
+    return collection
+
+
+def delete_documents(filenames, collection_name: str = "documents"):
+    """
+    Remove every chunk of the given documents, matched on the `filename`
+    metadata. Nothing else in the collection is touched or re-embedded.
+    Returns the number of chunks deleted.
+    """
+    filenames = list(filenames)
+    if not filenames:
+        return 0
+
+    collection = get_collection(collection_name)
+    where = {"filename": filenames[0]} if len(filenames) == 1 else {"filename": {"$in": filenames}}
+    ids = collection.get(where=where, include=[])["ids"]
+
+    batch = getattr(get_client(), "get_max_batch_size", lambda: 5000)()
+    for start in range(0, len(ids), batch):
+        collection.delete(ids=ids[start:start + batch])
+    if ids:
+        forget_chunks(collection_name, ids)
+        forget_vectors(collection_name, ids)
+        uncount_chunks(collection_name, ids)
+        bump_corpus_version(collection_name)
+
+    print(f"Deleted {len(ids)} chunks from {len(filenames)} documents")
+    return len(ids)